@@ -0,0 +1,69 @@
+"""Кэш общей для всех пользователей части представления рецептов."""
+from django.core.cache import cache
+
+from foodgram.constants import RECIPE_CACHE_TIMEOUT
+from recipes.versions import (INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY,
+                              get_versions, recipe_version_key,
+                              user_version_key)
+
+RECIPE_CACHE_HITS_KEY = 'recipe_cache_hits'
+RECIPE_CACHE_MISSES_KEY = 'recipe_cache_misses'
+
+
+def get_recipe_cache_keys(recipes, request):
+    """Ключи кэша представлений рецептов.
+
+    Ключ включает версии рецепта, его автора, тегов и ингредиентов,
+    поэтому изменение любой из них делает запись недоступной.
+    """
+    version_keys = {INGREDIENTS_VERSION_KEY, TAGS_VERSION_KEY}
+    for recipe in recipes:
+        version_keys.add(recipe_version_key(recipe.pk))
+        version_keys.add(user_version_key(recipe.author_id))
+    versions = get_versions(list(version_keys))
+    common = (
+        f'{versions[INGREDIENTS_VERSION_KEY]}:{versions[TAGS_VERSION_KEY]}:'
+        f'{request.scheme}://{request.get_host()}'
+    )
+    return [
+        f'recipe_repr:{recipe.pk}:'
+        f'{versions[recipe_version_key(recipe.pk)]}:'
+        f'{versions[user_version_key(recipe.author_id)]}:{common}'
+        for recipe in recipes
+    ]
+
+
+def get_cached_representations(keys):
+    return cache.get_many(keys)
+
+
+def set_cached_representations(representations):
+    cache.set_many(representations, RECIPE_CACHE_TIMEOUT)
+
+
+def increment(key, delta):
+    if not delta:
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def record_cache_stats(hits, misses):
+    """Учёт попаданий и промахов кэша рецептов."""
+    increment(RECIPE_CACHE_HITS_KEY, hits)
+    increment(RECIPE_CACHE_MISSES_KEY, misses)
+
+
+def get_cache_stats():
+    stats = cache.get_many((RECIPE_CACHE_HITS_KEY, RECIPE_CACHE_MISSES_KEY))
+    return (
+        stats.get(RECIPE_CACHE_HITS_KEY, 0),
+        stats.get(RECIPE_CACHE_MISSES_KEY, 0),
+    )
+
+
+def reset_cache_stats():
+    cache.delete_many((RECIPE_CACHE_HITS_KEY, RECIPE_CACHE_MISSES_KEY))
@@ -5,8 +5,11 @@ from django_filters.rest_framework import (
     ModelMultipleChoiceFilter,
     NumberFilter,
 )
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import CursorPagination
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 
 
 class IngredientsFilter(FilterSet):
@@ -18,6 +21,38 @@ class IngredientsFilter(FilterSet):
         fields = ('name',)
 
 
+class StableOrderingFilter(OrderingFilter):
+    """Сортировка по параметру ?ordering= с однозначным порядком.
+
+    К выбранным полям добавляется -id, чтобы записи с равными
+    значениями не повторялись и не терялись между страницами.
+    Псевдонимы из ordering_aliases вьюсета заменяются на поля.
+    Без параметра при курсорной пагинации используется её порядок.
+    """
+
+    def get_default_ordering(self, view):
+        ordering = super().get_default_ordering(view)
+        paginator = getattr(view, 'paginator', None)
+        if ordering is None and isinstance(paginator, CursorPagination):
+            ordering = paginator.ordering
+            if isinstance(ordering, str):
+                ordering = (ordering,)
+        return ordering
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        aliases = getattr(view, 'ordering_aliases', {})
+        return super().remove_invalid_fields(
+            queryset, [aliases.get(field, field) for field in fields],
+            view, request
+        )
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering = (*ordering, '-id')
+        return ordering
+
+
 class RecipeFilter(FilterSet):
     """Фильтр рецептов."""
 
@@ -31,10 +66,13 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = NumberFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = CharFilter(method='search_filter')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_in_shopping_cart', 'is_favorited')
+        fields = (
+            'tags', 'author', 'is_in_shopping_cart', 'is_favorited', 'search'
+        )
 
     def is_favorited_filter(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -45,3 +83,6 @@ class RecipeFilter(FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shop_cart__user=self.request.user)
         return queryset
+
+    def search_filter(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,36 @@
+"""
+Команда для просмотра статистики кэша рецептов.
+"""
+from django.core.management.base import BaseCommand
+
+from api.cache import get_cache_stats, reset_cache_stats
+from recipes.versions import is_shared_cache
+
+
+class Command(BaseCommand):
+    """Вывод числа попаданий и промахов кэша рецептов."""
+    help = 'Показывает эффективность кэша представлений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счётчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        if not is_shared_cache():
+            self.stderr.write(self.style.WARNING(
+                'Кэш хранится в памяти процесса: счётчики веб-сервера '
+                'этой команде недоступны. Настройте общий кэш '
+                '(CACHE_BACKEND).'
+            ))
+        hits, misses = get_cache_stats()
+        total = hits + misses
+        rate = hits / total * 100 if total else 0
+        self.stdout.write(
+            f'Попаданий: {hits}, промахов: {misses}, '
+            f'доля попаданий: {rate:.1f}%'
+        )
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,60 @@
+from hashlib import md5
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from recipes.versions import (get_versions, is_shared_cache,
+                              user_state_version_key)
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для списков и отдельных объектов.
+
+    ETag строится по версиям данных из etag_version_keys и не требует
+    сериализации ответа: при совпадении If-None-Match сразу отдаётся 304.
+    Для авторизованного пользователя в ETag входят его id и версия его
+    избранного, списка покупок и подписок. Если кэш не общий для всех
+    процессов, версии могут отставать от данных, и ETag не выдаётся.
+    """
+
+    etag_version_keys = ()
+    etag_user_state = False
+
+    def get_etag_version_keys(self, request):
+        keys = list(self.etag_version_keys)
+        if self.etag_user_state and request.user.is_authenticated:
+            keys.append(user_state_version_key(request.user.pk))
+        return keys
+
+    def get_etag(self, request):
+        keys = self.get_etag_version_keys(request)
+        versions = get_versions(keys)
+        parts = [versions[key] for key in keys]
+        parts += [
+            request.build_absolute_uri(),
+            request.META.get('HTTP_ACCEPT', ''),
+        ]
+        if self.etag_user_state:
+            parts.append(str(request.user.pk))
+        return 'W/"%s"' % md5('\n'.join(parts).encode()).hexdigest()
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if not is_shared_cache():
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -1,7 +1,212 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import (EmptyPage, InvalidPage, Page,
+                                   PageNotAnInteger, Paginator)
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from foodgram.constants import COUNT_CACHE_TIMEOUT, ESTIMATED_COUNT_THRESHOLD
+from recipes.feed import get_feed_page
+
+
+def get_planner_estimate(connection, sql, params):
+    """Оценка числа строк запроса по плану PostgreSQL."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор с дешёвым подсчётом количества объектов.
+
+    На PostgreSQL большие выборки считаются по оценке планировщика,
+    точные значения кэшируются по тексту запроса на короткое время.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            estimate = get_planner_estimate(connection, sql, params)
+            if estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        key = 'paginator_count:' + md5(f'{sql}{params}'.encode()).hexdigest()
+        return cache.get_or_set(key, queryset.count, COUNT_CACHE_TIMEOUT)
+
+
+class CountlessPage(Page):
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountlessPaginator(Paginator):
+    """Пагинатор без подсчёта количества объектов.
+
+    Наличие следующей страницы определяется по лишней строке выборки.
+    Число страниц известно только после чтения страницы, поэтому
+    ?page=last не поддерживается.
+    """
+
+    count = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._known_pages = None
+
+    @property
+    def num_pages(self):
+        return self._known_pages
+
+    def validate_number(self, number):
+        if number is None:
+            raise InvalidPage('Без подсчёта количества последняя страница '
+                              'неизвестна')
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не является числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            raise EmptyPage('На этой странице нет результатов')
+        has_next = len(items) > self.per_page
+        self._known_pages = number + has_next
+        return CountlessPage(items[:self.per_page], number, self, has_next)
 
 
 class Pagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class EstimatedCountPagination(Pagination):
+    """Постраничная пагинация с дешёвым полем count.
+
+    С параметром ?count=false количество не считается,
+    в поле count возвращается null.
+    """
+
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.count_query_param) in ('0', 'false'):
+            self.django_paginator_class = CountlessPaginator
+        else:
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты рецептов без COUNT и OFFSET."""
+
+    page_size_query_param = 'limit'
+    page_size = 6
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация подписок."""
+
+    ordering = ('username',)
+
+
+class FeedCursorPagination(CursorPagination):
+    """Курсорная пагинация ленты подписок.
+
+    Курсор хранит дату публикации и id последнего рецепта страницы,
+    страницы листаются только вперёд. Порядок рецептов задаёт лента,
+    переданная выборка нужна только для загрузки рецептов страницы.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = 6
+
+    def decode_position(self, request):
+        cursor = self.decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            pub_date, recipe_id = cursor.position.split(' ')
+            pub_date = parse_datetime(pub_date)
+            if pub_date is None:
+                raise ValueError
+            return pub_date, int(recipe_id)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        page = get_feed_page(
+            request.user, self.decode_position(request), self.page_size
+        )
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last_position = page[-1] if page else None
+        recipes = queryset.in_bulk([recipe_id for _, recipe_id in page])
+        return [
+            recipes[recipe_id] for _, recipe_id in page
+            if recipe_id in recipes
+        ]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        pub_date, recipe_id = self.last_position
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False,
+            position=f'{pub_date.isoformat()} {recipe_id}'
+        ))
+
+    def get_previous_link(self):
+        return None
+
+
+class CursorPaginationMixin:
+    """Включает курсорную пагинацию, если передан параметр ?cursor.
+
+    Для первой страницы достаточно передать пустой ?cursor=,
+    ссылки next и previous содержат курсор следующих страниц.
+    """
+
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, '_paginator')
+            and self.cursor_pagination_class is not None
+            and self.cursor_pagination_class.cursor_query_param
+            in self.request.query_params
+        ):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
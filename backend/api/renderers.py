@@ -0,0 +1,150 @@
+import csv
+import os
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.exceptions import NotAcceptable, ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+class ShoppingCartNegotiation(DefaultContentNegotiation):
+    """Выбор формата списка покупок.
+
+    Формат задаётся параметром ?format= или заголовком Accept. Если
+    заголовок не подходит ни к одному формату, отдаётся первый рендерер,
+    на неизвестный ?format= возвращается 400 со списком форматов.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        format = format_suffix or request.query_params.get(format_query_param)
+        formats = [renderer.format for renderer in renderers]
+        if format and format not in formats:
+            raise ValidationError({
+                format_query_param: (
+                    f'Неподдерживаемый формат {format}. '
+                    f'Доступные форматы: {", ".join(formats)}.'
+                )
+            })
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    Сам список отдаётся потоком через stream(), через render()
+    проходят только ответы с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(
+                ' '.join(map(str, value)) if isinstance(value, list)
+                else str(value)
+                for value in data.values()
+            )
+        return str(data or '')
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    @staticmethod
+    def format_line(ingredient):
+        return (
+            f'{ingredient["name"]}: '
+            f'{ingredient["amount"]} '
+            f'{ingredient["measurement_unit"]}.'
+        )
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в виде текстового файла."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, ingredients):
+        for ingredient in ingredients:
+            yield self.format_line(ingredient) + '\n'
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['name'],
+                ingredient['amount'],
+                ingredient['measurement_unit'],
+            ))
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    """Список покупок в формате PDF."""
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(data).encode()
+
+    @staticmethod
+    def get_font_name():
+        if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+            return PDF_FONT_NAME
+        if not os.path.exists(settings.SHOPPING_CART_PDF_FONT):
+            return 'Helvetica'
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_CART_PDF_FONT)
+        )
+        return PDF_FONT_NAME
+
+    def stream(self, ingredients):
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        font_name = self.get_font_name()
+        _, height = A4
+        y = height - PDF_MARGIN
+        canvas.setFont(font_name, PDF_FONT_SIZE)
+        for ingredient in ingredients:
+            if y < PDF_MARGIN:
+                canvas.showPage()
+                canvas.setFont(font_name, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            canvas.drawString(PDF_MARGIN, y, self.format_line(ingredient))
+            y -= PDF_LINE_HEIGHT
+        canvas.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
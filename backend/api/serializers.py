@@ -1,19 +1,50 @@
+import json
+from collections import Counter, OrderedDict
+
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
-from rest_framework.serializers import (CharField, IntegerField,
-                                        ModelSerializer,
+from PIL import Image
+from rest_framework.serializers import (CharField, Field, FileField,
+                                        IntegerField, ListField,
+                                        ListSerializer, ModelSerializer,
                                         PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField, ValidationError)
+                                        Serializer, SerializerMethodField,
+                                        ValidationError)
 
-from foodgram.constants import MAX_VALUE, MIN_VALUE
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag)
-from users.models import Subscription
+from api.cache import (get_cached_representations, get_recipe_cache_keys,
+                       record_cache_stats, set_cached_representations)
+from foodgram.constants import MAX_BATCH_RECIPES, MAX_VALUE, MIN_VALUE
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.shopping_lists import update_shopping_lists
 
 User = get_user_model()
 
 
+def get_subscribed_ids(request):
+    """Идентификаторы авторов, на которых подписан пользователь запроса.
+
+    Загружаются один раз за запрос и используются всеми вложенными
+    сериализаторами пользователей.
+    """
+    if not hasattr(request, '_subscribed_ids'):
+        request._subscribed_ids = set(
+            request.user.follower.values_list('author_id', flat=True)
+        )
+    return request._subscribed_ids
+
+
+def reset_subscribed_ids(request):
+    """Сброс подписок запроса после подписки или отписки."""
+    if hasattr(request, '_subscribed_ids'):
+        del request._subscribed_ids
+
+
 class UserRegistrationSerializer(UserCreateSerializer):
     """Сериализатор для регистрации пользователя."""
 
@@ -48,15 +79,18 @@ class UserSerializer(ModelSerializer):
         model = User
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
-            'is_subscribed'
+            'is_subscribed', 'recipes_count', 'followers_count'
         )
 
     def get_is_subscribed(self, obj):
         """Получение информации о подписке."""
-        user = self.context.get('request').user
-        return user.is_authenticated and user.follower.filter(
-            author=obj.id
-        ).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        return (
+            request.user.is_authenticated
+            and obj.id in get_subscribed_ids(request)
+        )
 
 
 class TagSerializer(ModelSerializer):
@@ -87,10 +121,27 @@ class IngredientRecipeCreateSerializer(ModelSerializer):
         model = IngredientRecipe
         fields = ('id', 'amount')
 
-    def validate_id(self, value):
-        if not Ingredient.objects.filter(pk=value).exists():
-            raise ValidationError('Ингредиент с указанным ID не найден.')
-        return value
+
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта строкой base64 или файлом multipart/form-data.
+
+    Загруженный файл проверяется по заголовку, без декодирования
+    всего изображения.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, UploadedFile):
+            return super().to_internal_value(data)
+        try:
+            with Image.open(data) as image:
+                image_format = image.format
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        if image_format.lower() not in self.ALLOWED_TYPES:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        data.seek(0)
+        data.name = f'{self.get_file_name(data)}.{image_format.lower()}'
+        return FileField.to_internal_value(self, data)
 
 
 class CreateRecipeSerializer(ModelSerializer):
@@ -101,7 +152,7 @@ class CreateRecipeSerializer(ModelSerializer):
     )
     author = UserSerializer(read_only=True)
     tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
-    image = Base64ImageField(required=True)
+    image = RecipeImageField(required=True)
     text = CharField(source='description')
     cooking_time = IntegerField(
         write_only=True, min_value=MIN_VALUE, max_value=MAX_VALUE
@@ -114,6 +165,30 @@ class CreateRecipeSerializer(ModelSerializer):
             'cooking_time', 'text'
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_multipart(data):
+        """Приводит multipart/form-data к виду JSON-запроса.
+
+        Теги передаются повторяющимся полем tags, ингредиенты -
+        JSON-строкой в поле ingredients.
+        """
+        parsed = data.dict()
+        parsed['tags'] = data.getlist('tags')
+        ingredients = data.get('ingredients')
+        if isinstance(ingredients, str):
+            try:
+                parsed['ingredients'] = json.loads(ingredients)
+            except ValueError:
+                raise ValidationError(
+                    {'ingredients': 'Некорректный JSON'}
+                )
+        return parsed
+
     def validate(self, attrs):
         tags = attrs.get('tags')
         ingredients = attrs.get('ingredients')
@@ -136,6 +211,16 @@ class CreateRecipeSerializer(ModelSerializer):
             raise ValidationError(
                 {'ingredients': 'Дублирование ингредиентов'}
             )
+        found = Ingredient.objects.in_bulk(unique_ingr)
+        errors = [
+            {} if item['id'] in found
+            else {'id': ['Ингредиент с указанным ID не найден.']}
+            for item in ingredients
+        ]
+        if any(errors):
+            raise ValidationError({'ingredients': errors})
+        for item in ingredients:
+            item['ingredient'] = found[item['id']]
 
         return attrs
 
@@ -149,12 +234,24 @@ class CreateRecipeSerializer(ModelSerializer):
         ingredient_instances = [
             IngredientRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient_data['id'],
+                ingredient=ingredient_data['ingredient'],
                 amount=ingredient_data['amount']
             )
             for ingredient_data in ingredients
         ]
-        IngredientRecipe.objects.bulk_create(ingredient_instances)
+        return IngredientRecipe.objects.bulk_create(ingredient_instances)
+
+    @staticmethod
+    def set_related(recipe, ingredient_instances, tags):
+        """Передаёт ответу уже загруженные ингредиенты и теги рецепта.
+
+        Порядок совпадает с порядком при предварительной загрузке
+        в ReadRecipeSerializer, поэтому повторных запросов не нужно.
+        """
+        recipe.recipe_ingredients = sorted(
+            ingredient_instances, key=lambda item: item.ingredient.name
+        )
+        recipe.recipe_tags = sorted(tags, key=lambda tag: tag.name)
 
     def create(self, validated_data):
         """Создание рецепта."""
@@ -164,20 +261,102 @@ class CreateRecipeSerializer(ModelSerializer):
             author=self.context['request'].user,
             **validated_data
         )
-        self.ingredient_recipe_bulk_create(ingredient, recipe)
+        ingredient_instances = self.ingredient_recipe_bulk_create(
+            ingredient, recipe
+        )
         recipe.tags.set(tags)
+        self.set_related(recipe, ingredient_instances, tags)
         return recipe
 
+    def update_recipe_ingredients(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к переданным.
+
+        Записи меняются только там, где есть разница: новые ингредиенты
+        добавляются, убранные удаляются, у остальных обновляется
+        количество. Возвращает записи ингредиентов рецепта и прежние
+        количества или None вместо них, если ничего не изменилось.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = Counter({
+            ingredient_id: item.amount
+            for ingredient_id, item in current.items()
+        })
+        submitted = {item['id']: item for item in ingredients}
+        to_delete = [
+            item.pk for ingredient_id, item in current.items()
+            if ingredient_id not in submitted
+        ]
+        instances = []
+        to_update = []
+        to_create = []
+        for ingredient_id, ingredient_data in submitted.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                to_create.append(ingredient_data)
+                continue
+            item.ingredient = ingredient_data['ingredient']
+            instances.append(item)
+            if item.amount != ingredient_data['amount']:
+                item.amount = ingredient_data['amount']
+                to_update.append(item)
+        if not (to_delete or to_update or to_create):
+            return instances, None
+        if to_delete:
+            IngredientRecipe.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ('amount',))
+        if to_create:
+            instances += self.ingredient_recipe_bulk_create(to_create, recipe)
+        return instances, old_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredient = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self.ingredient_recipe_bulk_create(ingredient, instance)
-        instance.tags.set(validated_data.pop('tags'))
+        ingredient_instances, old_amounts = self.update_recipe_ingredients(
+            validated_data.pop('ingredients'), instance
+        )
+        if old_amounts is not None:
+            update_shopping_lists(instance, old_amounts)
+        tags = validated_data.pop('tags')
+        instance.tags.set(tags)
+        self.set_related(instance, ingredient_instances, tags)
         return super().update(
             instance, validated_data)
 
     def to_representation(self, instance):
-        return ReadRecipeSerializer(instance, context=self.context).data
+        # Экземпляр после записи может отставать от базы (копии
+        # изображения строятся после фиксации транзакции), поэтому
+        # в общий кэш его представление не попадает.
+        return ReadRecipeSerializer(
+            instance, context={**self.context, 'use_cache': False}
+        ).data
+
+
+class ImageVariantsField(Field):
+    """Ссылки на уменьшенные копии изображения рецепта.
+
+    Копии строятся в фоне, пока они не готовы, возвращается
+    пустой словарь.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'image_variants')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return {
+            variant: {
+                extension: request.build_absolute_uri(
+                    default_storage.url(name)
+                )
+                for extension, name in files.items()
+            }
+            for variant, files in value.get('variants', {}).items()
+        }
 
 
 class ReadIngredientRecipeSerializer(ModelSerializer):
@@ -192,27 +371,127 @@ class ReadIngredientRecipeSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class ReadRecipeListSerializer(ListSerializer):
+    """Сериализатор списка рецептов с общим кэшем представлений."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.represent_many(list(recipes))
+
+
 class ReadRecipeSerializer(ModelSerializer):
-    """Сериализатор для чтения рецепта."""
+    """Сериализатор для чтения рецепта.
+
+    Часть представления, одинаковая для всех пользователей, кэшируется
+    по версиям рецепта, автора, тегов и ингредиентов. Поля, зависящие
+    от пользователя, подставляются после чтения из кэша.
+    """
 
     author = UserSerializer(read_only=True)
     ingredients = ReadIngredientRecipeSerializer(
-        many=True, read_only=True, source='recipe'
+        many=True, read_only=True, source='recipe_ingredients'
     )
-    tags = TagSerializer(many=True, read_only=True)
+    tags = TagSerializer(many=True, read_only=True, source='recipe_tags')
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     text = CharField(source='description')
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'images', 'text',
+            'cooking_time', 'favorites_count', 'shopping_cart_count'
+        )
+        list_serializer_class = ReadRecipeListSerializer
+
+    user_fields = ('is_favorited', 'is_in_shopping_cart')
+    # Счётчики меняются без сброса кэша и берутся из самой записи.
+    counter_fields = ('favorites_count', 'shopping_cart_count')
+    author_counter_fields = User.counter_fields
+
+    @staticmethod
+    def get_prefetch_lookups():
+        """Связанные объекты, необходимые для сериализации рецепта."""
+        return (
+            Prefetch('tags', to_attr='recipe_tags'),
+            Prefetch(
+                'recipe',
+                queryset=IngredientRecipe.objects.select_related('ingredient'),
+                to_attr='recipe_ingredients'
+            ),
+        )
+
+    def get_shared_representation(self, instance):
+        """Представление рецепта без полей, зависящих от пользователя."""
+        ret = {}
+        for field in self._readable_fields:
+            if field.field_name in (*self.user_fields, *self.counter_fields):
+                continue
+            attribute = field.get_attribute(instance)
+            ret[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        return ret
+
+    def represent_many(self, recipes):
+        """Представления рецептов с использованием общего кэша."""
+        request = self.context.get('request')
+        use_cache = self.context.get('use_cache', True)
+        keys = get_recipe_cache_keys(recipes, request)
+        shared = get_cached_representations(keys) if use_cache else {}
+        misses = [
+            recipe for recipe, key in zip(recipes, keys) if key not in shared
+        ]
+        if misses:
+            prefetch_related_objects(misses, *self.get_prefetch_lookups())
+            fresh = {
+                key: self.get_shared_representation(recipe)
+                for recipe, key in zip(recipes, keys) if key not in shared
+            }
+            shared.update(fresh)
+            if use_cache:
+                set_cached_representations(fresh)
+        if use_cache:
+            record_cache_stats(len(recipes) - len(misses), len(misses))
+        subscribed_ids = (
+            get_subscribed_ids(request)
+            if request.user.is_authenticated else set()
         )
+        representations = []
+        for recipe, key in zip(recipes, keys):
+            data = shared[key]
+            user_data = {
+                'is_favorited': self.get_is_favorited(recipe),
+                'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+                'author': {
+                    **data['author'],
+                    'is_subscribed': recipe.author_id in subscribed_ids,
+                    **{
+                        name: getattr(recipe.author, name)
+                        for name in self.author_counter_fields
+                    },
+                },
+                **{
+                    name: getattr(recipe, name)
+                    for name in self.counter_fields
+                },
+            }
+            representations.append(OrderedDict(
+                (name, user_data[name] if name in user_data else data[name])
+                for name in self.Meta.fields
+            ))
+        return representations
+
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
 
     def get_is_favorited(self, obj):
         """Получение информации о добавлении рецепта в избранное."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return user.is_authenticated and user.favorites.filter(
             recipe=obj
@@ -220,6 +499,8 @@ class ReadRecipeSerializer(ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Получение информации о добавлении рецепта в список покупок."""
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return user.is_authenticated and user.shop_cart.filter(
             recipe=obj
@@ -229,9 +510,11 @@ class ReadRecipeSerializer(ModelSerializer):
 class ShortCutRecipeSerializer(ModelSerializer):
     """Сериализатор коротокого отображения рецепта"""
 
+    images = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
@@ -239,12 +522,9 @@ class SubscriptionSerializer(UserSerializer):
     """Сериализатор подписок"""
 
     recipes = SerializerMethodField(method_name='get_recipe')
-    recipes_count = SerializerMethodField(
-        method_name='get_recipes_count'
-    )
 
     class Meta(UserSerializer.Meta):
-        fields = UserSerializer.Meta.fields + ('recipes_count', 'recipes')
+        fields = UserSerializer.Meta.fields + ('recipes',)
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_recipe(self, obj):
@@ -260,81 +540,12 @@ class SubscriptionSerializer(UserSerializer):
         ).data
         return serialized_recipes
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
-
-class SubscriptionCreateSerializer(ModelSerializer):
-    '''Сериализатор для создания подписки.'''
-
-    class Meta:
-        model = Subscription
-        fields = (
-            'user',
-            'author'
-        )
-
-    def validate(self, attrs):
-        user = attrs['user']
-        author = attrs['author']
-        if not User.objects.filter(pk=author.pk).exists():
-            raise ValidationError({'author': 'Автор не найден.'})
-        if user == author:
-            raise ValidationError(
-                {'author': 'Нельзя подписаться на себя.'}
-            )
-        if user.follower.filter(author=author).exists():
-            raise ValidationError(
-                {'author': 'Уже подписан.'}
-            )
-
-        return attrs
-
-    def to_representation(self, instance):
-        return SubscriptionSerializer(
-            instance.author,
-            context=self.context
-        ).data
-
 
-class BaseRecipeSerializer(ModelSerializer):
-    """Базовый сериализатор для избранных рецептов и списка покупок."""
+class RecipeIdsSerializer(Serializer):
+    """Сериализатор списка id рецептов для массовых операций."""
 
-    class Meta:
-        abstract = True
-        model = None
-        fields = (
-            'user',
-            'recipe'
-        )
-
-    def validate(self, attrs):
-        user = attrs['user']
-        recipe = attrs['recipe']
-        if self.Meta.model.objects.filter(
-            user=user,
-            recipe=recipe
-        ).exists():
-            raise ValidationError(
-                {'recipe': 'Уже существует.'}
-            )
-        return attrs
-
-    def to_representation(self, instance):
-        return ShortCutRecipeSerializer(
-            instance.recipe, context=self.context
-        ).data
-
-
-class ShoppingCartSerializer(BaseRecipeSerializer):
-    """Сериализатор списка покупок."""
-
-    class Meta(BaseRecipeSerializer.Meta):
-        model = ShoppingCart
-
-
-class FavoriteRecipeSerializer(BaseRecipeSerializer):
-    """Сериализатор избранных рецептов."""
-
-    class Meta(BaseRecipeSerializer.Meta):
-        model = FavoriteRecipe
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BATCH_RECIPES,
+    )
@@ -0,0 +1,964 @@
+import csv
+import json
+import shutil
+import tempfile
+from base64 import b64encode
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from foodgram.constants import (INGREDIENT_AUTOCOMPLETE_LIMIT,
+                                INGREDIENT_FUZZY_LIMIT)
+from recipes.counters import reconcile_counters
+from recipes.models import (FavoriteRecipe, FeedItem, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart, Tag,
+                            TagsRecipe)
+from recipes.scores import update_recipe_scores
+from recipes.search import ingredient_index, recipe_index
+from recipes.shopping_lists import get_expected_amounts, get_stored_amounts
+from recipes.versions import get_version
+from users.models import Subscription, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def make_png():
+    buffer = BytesIO()
+    Image.new('RGB', (4, 3), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_image():
+    return 'data:image/png;base64,' + b64encode(make_png()).decode()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CACHES=LOCMEM_CACHES)
+class ApiTestCase(TestCase):
+    """Общие данные для тестов API: теги, ингредиенты, авторы, рецепты."""
+
+    recipes_per_author = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(10)
+        ]
+        cls.user = User.objects.create_user(
+            email='user@foodgram.ru', username='user', password='password',
+            first_name='Иван', last_name='Иванов'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{i}@foodgram.ru', username=f'author{i}',
+                password='password', first_name='Пётр', last_name='Петров'
+            )
+            for i in range(3)
+        ]
+        for author in cls.authors:
+            Subscription.objects.create(user=cls.user, author=author)
+            for i in range(cls.recipes_per_author):
+                cls.create_recipe(author, f'Рецепт {author.username} {i}')
+
+    @classmethod
+    def create_recipe(cls, author, name):
+        recipe = Recipe.objects.create(
+            author=author, name=name, image='recipes/image.png',
+            description='Описание', cooking_time=10
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in cls.ingredients[:3]
+        )
+        TagsRecipe.objects.bulk_create(
+            TagsRecipe(recipe=recipe, tag=tag) for tag in cls.tags[:2]
+        )
+        return recipe
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        # Индексы в памяти не знают об откате транзакции теста.
+        ingredient_index.invalidate()
+        recipe_index.invalidate()
+        self.guest_client = APIClient()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(self.user)
+
+    def assert_consistent(self):
+        """Счётчики и итоги списков покупок совпадают с пересчётом."""
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+        self.assertEqual(get_stored_amounts(), get_expected_amounts())
+
+    def walk(self, url, client=None):
+        """Проходит все страницы и возвращает id объектов."""
+        client = client or self.authorized_client
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+
+class CursorPaginationTest(ApiTestCase):
+    """Курсорная пагинация по параметру ?cursor=."""
+
+    def test_recipes_cursor(self):
+        ids = self.walk('/api/recipes/?cursor=&limit=5')
+        self.assertEqual(
+            ids,
+            list(Recipe.objects.order_by(
+                '-pub_date', '-id'
+            ).values_list('id', flat=True))
+        )
+
+    def test_subscriptions_cursor(self):
+        ids = self.walk('/api/users/subscriptions/?cursor=&limit=2')
+        self.assertEqual(ids, [author.id for author in self.authors])
+
+
+class CountlessPaginationTest(ApiTestCase):
+    """Постраничная пагинация без подсчёта количества: ?count=false."""
+
+    def test_pages(self):
+        response = self.guest_client.get('/api/recipes/?count=false&limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+        response = self.guest_client.get(
+            '/api/recipes/?count=false&limit=5&page=3'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_pages(self):
+        for page in ('last', '4', '0', 'abc'):
+            with self.subTest(page=page):
+                response = self.guest_client.get(
+                    f'/api/recipes/?count=false&limit=5&page={page}'
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipeQueryCountTest(ApiTestCase):
+    """Число запросов чтения и записи рецептов не зависит от объёма."""
+
+    # Страница: количество, рецепты, теги, ингредиенты, подписки.
+    # На PostgreSQL количество сначала оценивается по плану запроса.
+    LIST_QUERIES = 5 + (connection.vendor == 'postgresql')
+    # Рецепт, теги, ингредиенты, подписки.
+    RETRIEVE_QUERIES = 4
+    CREATE_QUERIES = 11
+    UPDATE_QUERIES = 15
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.authors[0])
+        self.recipe = Recipe.objects.filter(author=self.authors[0]).first()
+
+    def get_recipe_data(self, ingredients_count):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'tags': [self.tags[0].id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 2}
+                for ingredient in self.ingredients[:ingredients_count]
+            ],
+        }
+
+    def test_list(self):
+        for limit in (2, 10):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = self.authorized_client.get(
+                        f'/api/recipes/?limit={limit}'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_retrieve(self):
+        with self.assertNumQueries(self.RETRIEVE_QUERIES):
+            response = self.authorized_client.get(
+                f'/api/recipes/{self.recipe.id}/'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['ingredients']), 3)
+
+    def test_create(self):
+        for ingredients_count in (2, 8):
+            with self.subTest(ingredients_count=ingredients_count):
+                data = {
+                    **self.get_recipe_data(ingredients_count),
+                    'image': make_image(),
+                }
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.author_client.post(
+                        '/api/recipes/', data, format='json'
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(
+                    len(response.data['ingredients']), ingredients_count
+                )
+
+    def test_update(self):
+        # У рецептов по 3 ингредиента: количества обновляются,
+        # недостающие ингредиенты добавляются.
+        recipes = Recipe.objects.filter(author=self.authors[0])[:2]
+        for recipe, ingredients_count in zip(recipes, (4, 10)):
+            with self.subTest(ingredients_count=ingredients_count):
+                with self.assertNumQueries(self.UPDATE_QUERIES):
+                    response = self.author_client.patch(
+                        f'/api/recipes/{recipe.id}/',
+                        self.get_recipe_data(ingredients_count),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.data['ingredients']), ingredients_count
+                )
+
+
+class MultipartRecipeTest(ApiTestCase):
+    """Создание и изменение рецепта запросом multipart/form-data."""
+
+    def setUp(self):
+        super().setUp()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.authors[0])
+
+    def get_form(self, image):
+        return {
+            'name': 'Рецепт с файлом',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': json.dumps([
+                {'id': ingredient.id, 'amount': 2}
+                for ingredient in self.ingredients[:2]
+            ]),
+            'image': image,
+        }
+
+    def test_create_and_update(self):
+        response = self.author_client.post(
+            '/api/recipes/',
+            self.get_form(SimpleUploadedFile('photo.dat', make_png())),
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertTrue(recipe.image.name.endswith('.png'))
+        self.assertEqual(recipe.image.read(), make_png())
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)),
+            {tag.id for tag in self.tags[:2]}
+        )
+        self.assertEqual(recipe.ingredients.count(), 2)
+        old_image = recipe.image.name
+        response = self.author_client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {
+                **self.get_form(SimpleUploadedFile('new.png', make_png())),
+                'name': 'Новое название',
+            },
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertNotEqual(recipe.image.name, old_image)
+
+    def test_invalid_image(self):
+        for image in (
+            SimpleUploadedFile('image.png', b'not an image'),
+            'not a file',
+        ):
+            with self.subTest(image=image):
+                response = self.author_client.post(
+                    '/api/recipes/', self.get_form(image), format='multipart'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.data)
+
+    def test_invalid_ingredients(self):
+        response = self.author_client.post(
+            '/api/recipes/',
+            {
+                **self.get_form(SimpleUploadedFile('photo.png', make_png())),
+                'ingredients': '[{',
+            },
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+
+
+@override_settings(CACHES=settings.CACHES)
+class DefaultCacheQueryCountTest(ApiTestCase):
+    """Бюджет запросов списка рецептов с кэшем из настроек проекта."""
+
+    # Повторный запрос берёт количество и представления из кэша:
+    # остаются рецепты и подписки, на PostgreSQL ещё оценка количества.
+    WARM_LIST_QUERIES = 2 + (connection.vendor == 'postgresql')
+
+    def test_list(self):
+        for queries in (
+            RecipeQueryCountTest.LIST_QUERIES, self.WARM_LIST_QUERIES
+        ):
+            with self.assertNumQueries(queries):
+                response = self.authorized_client.get('/api/recipes/?limit=6')
+            self.assertEqual(response.status_code, 200)
+
+
+class IngredientSearchTest(ApiTestCase):
+    """Автодополнение ингредиентов возвращает ограниченный список."""
+
+    def test_search_limit(self):
+        for i in range(INGREDIENT_AUTOCOMPLETE_LIMIT):
+            Ingredient.objects.create(
+                name=f'Соль морская {i}', measurement_unit='г'
+            )
+        Ingredient.objects.create(name='Сахар', measurement_unit='г')
+        response = self.guest_client.get('/api/ingredients/?name=с')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), INGREDIENT_AUTOCOMPLETE_LIMIT)
+        self.assertEqual(response.data[0]['name'], 'Сахар')
+        response = self.guest_client.get('/api/ingredients/?name=ент')
+        self.assertEqual(len(response.data), len(self.ingredients))
+
+    def test_version_check_interval(self):
+        with mock.patch(
+            'recipes.search.get_version', wraps=get_version
+        ) as version:
+            for name in ('ин', 'инг', 'ингр'):
+                response = self.guest_client.get(
+                    f'/api/ingredients/?name={name}'
+                )
+                self.assertEqual(len(response.data), len(self.ingredients))
+        self.assertEqual(version.call_count, 1)
+
+    def test_fuzzy_search_limit(self):
+        for i in range(INGREDIENT_FUZZY_LIMIT):
+            Ingredient.objects.create(
+                name=f'Ингредиент {i} сорт', measurement_unit='кг'
+            )
+        response = self.guest_client.get(
+            '/api/ingredients/?name=ингредиетн&fuzzy=true'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), INGREDIENT_FUZZY_LIMIT)
+        response = self.guest_client.get(
+            '/api/ingredients/?name=ябл&fuzzy=true'
+        )
+        self.assertEqual(response.data, [])
+
+
+class RecipeSearchTest(ApiTestCase):
+    """Поиск рецептов по параметру ?search=."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        author = cls.authors[0]
+        cls.borscht = Recipe.objects.create(
+            author=author, name='Борщ украинский', image='recipes/image.png',
+            description='Свёкла и капуста', cooking_time=60
+        )
+        cls.soup = Recipe.objects.create(
+            author=author, name='Суп', image='recipes/image.png',
+            description='Почти борщ', cooking_time=30
+        )
+        cls.green_borscht = Recipe.objects.create(
+            author=author, name='Борщ зелёный', image='recipes/image.png',
+            description='Щавель', cooking_time=40
+        )
+        TagsRecipe.objects.create(recipe=cls.green_borscht, tag=cls.tags[2])
+        FavoriteRecipe.objects.create(user=cls.user, recipe=cls.borscht)
+
+    def search(self, query):
+        response = self.authorized_client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.search('search=борщ'),
+            [self.green_borscht.id, self.borscht.id, self.soup.id]
+        )
+
+    def test_prefix(self):
+        self.assertEqual(
+            self.search('search=бор'),
+            [self.green_borscht.id, self.borscht.id, self.soup.id]
+        )
+        self.assertEqual(
+            self.search('search=зел бор'), [self.green_borscht.id]
+        )
+
+    def test_with_filters(self):
+        self.assertEqual(
+            self.search(f'search=борщ&tags={self.tags[2].slug}'),
+            [self.green_borscht.id]
+        )
+        self.assertEqual(
+            self.search('search=борщ&is_favorited=1'), [self.borscht.id]
+        )
+
+    def test_no_matches(self):
+        for query in ('search=пицца', 'search=борщ пицца', 'search=%2B%2B'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), [])
+
+
+class AuthorCountersTest(ApiTestCase):
+    """Счётчики автора в рецепте не отстают от кэша представлений."""
+
+    def test_counters(self):
+        author = self.authors[0]
+        url = f'/api/recipes/{Recipe.objects.filter(author=author)[0].id}/'
+        data = self.guest_client.get(url).data['author']
+        self.assertEqual(data['recipes_count'], self.recipes_per_author)
+        self.assertEqual(data['followers_count'], 1)
+        follower = User.objects.create_user(
+            email='follower@foodgram.ru', username='follower',
+            password='password', first_name='Сидор', last_name='Сидоров'
+        )
+        client = APIClient()
+        client.force_authenticate(follower)
+        response = client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['followers_count'], 2)
+        data = self.guest_client.get(url).data['author']
+        self.assertEqual(data['followers_count'], 2)
+
+
+class BatchMarksTest(ApiTestCase):
+    """Пакетное добавление и удаление в избранном и списке покупок."""
+
+    def change(self, method, url, recipe_ids):
+        response = getattr(self.authorized_client, method)(
+            url, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            item['id']: item['status'] for item in response.data['recipes']
+        }
+
+    def test_batch(self):
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        )
+        missing_id = Recipe.objects.order_by('pk').last().pk + 1
+        for name, model in (
+            ('favorite', FavoriteRecipe), ('shopping_cart', ShoppingCart)
+        ):
+            with self.subTest(name=name):
+                url = f'/api/recipes/{name}/batch/'
+                self.assertEqual(
+                    self.change('post', url, recipe_ids + [missing_id]),
+                    {
+                        **dict.fromkeys(recipe_ids, 'added'),
+                        missing_id: 'not_found',
+                    }
+                )
+                self.assert_consistent()
+                self.assertEqual(
+                    self.change('post', url, recipe_ids),
+                    dict.fromkeys(recipe_ids, 'exists')
+                )
+                self.assertEqual(
+                    model.objects.filter(user=self.user).count(),
+                    len(recipe_ids)
+                )
+                self.assert_consistent()
+                self.assertEqual(
+                    self.change('delete', url, recipe_ids),
+                    dict.fromkeys(recipe_ids, 'removed')
+                )
+                self.assertEqual(
+                    self.change('delete', url, recipe_ids),
+                    dict.fromkeys(recipe_ids, 'not_in_list')
+                )
+                self.assertFalse(model.objects.filter(user=self.user))
+                self.assert_consistent()
+
+    def test_shopping_list(self):
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        )
+        url = '/api/recipes/shopping_cart/batch/'
+        self.change('post', url, recipe_ids)
+        self.change('post', url, recipe_ids[:1])
+        self.assertEqual(get_stored_amounts((self.user.id,)), {
+            (self.user.id, ingredient.id): 5 * len(recipe_ids)
+            for ingredient in self.ingredients[:3]
+        })
+        self.change('delete', url, recipe_ids[1:])
+        self.change('delete', url, recipe_ids[1:])
+        self.assertEqual(get_stored_amounts((self.user.id,)), {
+            (self.user.id, ingredient.id): 5
+            for ingredient in self.ingredients[:3]
+        })
+
+
+class ToggleMarksTest(ApiTestCase):
+    """Одиночное добавление и удаление отметок и подписок."""
+
+    def test_recipe_marks(self):
+        recipe = Recipe.objects.order_by('pk').first()
+        missing_id = Recipe.objects.order_by('pk').last().pk + 1
+        for name, model in (
+            ('favorite', FavoriteRecipe), ('shopping_cart', ShoppingCart)
+        ):
+            with self.subTest(name=name):
+                url = f'/api/recipes/{recipe.id}/{name}/'
+                response = self.authorized_client.post(url)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(response.data['id'], recipe.id)
+                self.assert_consistent()
+                response = self.authorized_client.post(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(
+                    model.objects.filter(user=self.user).count(), 1
+                )
+                self.assert_consistent()
+                response = self.authorized_client.delete(url)
+                self.assertEqual(response.status_code, 204)
+                response = self.authorized_client.delete(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(model.objects.filter(user=self.user))
+                self.assert_consistent()
+                url = f'/api/recipes/{missing_id}/{name}/'
+                self.assertEqual(
+                    self.authorized_client.post(url).status_code, 400
+                )
+                self.assertEqual(
+                    self.authorized_client.delete(url).status_code, 404
+                )
+
+    def test_shopping_list(self):
+        recipe = Recipe.objects.order_by('pk').first()
+        url = f'/api/recipes/{recipe.id}/shopping_cart/'
+        self.authorized_client.post(url)
+        self.authorized_client.post(url)
+        self.assertEqual(get_stored_amounts((self.user.id,)), {
+            (self.user.id, ingredient.id): 5
+            for ingredient in self.ingredients[:3]
+        })
+        self.authorized_client.delete(url)
+        self.authorized_client.delete(url)
+        self.assertFalse(get_stored_amounts((self.user.id,)))
+
+    def test_subscription(self):
+        author = self.authors[0]
+        url = f'/api/users/{author.id}/subscribe/'
+        response = self.authorized_client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        response = self.authorized_client.delete(url)
+        self.assertEqual(response.status_code, 400)
+        self.assert_consistent()
+        response = self.authorized_client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['followers_count'], 1)
+        response = self.authorized_client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            Subscription.objects.filter(user=self.user, author=author).count(),
+            1
+        )
+        self.assert_consistent()
+        response = self.authorized_client.post(
+            f'/api/users/{self.user.id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ShoppingCartDownloadTest(ApiTestCase):
+    """Скачивание списка покупок в форматах txt, csv и pdf."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        for recipe in Recipe.objects.filter(author=self.authors[0])[:2]:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def download(self, query='', **headers):
+        response = self.authorized_client.get(self.url + query, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt(self):
+        for query, headers in (
+            ('?format=txt', {}),
+            ('', {}),
+            ('', {'HTTP_ACCEPT': 'application/json'}),
+        ):
+            with self.subTest(query=query, headers=headers):
+                response, content = self.download(query, **headers)
+                self.assertEqual(
+                    response['Content-Type'], 'text/plain; charset=utf-8'
+                )
+                self.assertEqual(
+                    response['Content-Disposition'],
+                    'attachment; filename=wishlist.txt'
+                )
+                self.assertEqual(content.decode(), ''.join(
+                    f'{ingredient.name}: 10 г.\n'
+                    for ingredient in self.ingredients[:3]
+                ))
+
+    def test_csv(self):
+        response, content = self.download('?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename=wishlist.csv'
+        )
+        self.assertEqual(
+            list(csv.reader(content.decode().splitlines())),
+            [['Ингредиент', 'Количество', 'Единица измерения']] + [
+                [ingredient.name, '10', 'г']
+                for ingredient in self.ingredients[:3]
+            ]
+        )
+
+    def test_pdf(self):
+        for query, headers in (
+            ('?format=pdf', {}),
+            ('', {'HTTP_ACCEPT': 'application/pdf'}),
+        ):
+            with self.subTest(query=query, headers=headers):
+                response, content = self.download(query, **headers)
+                self.assertEqual(response['Content-Type'], 'application/pdf')
+                self.assertEqual(
+                    response['Content-Disposition'],
+                    'attachment; filename=wishlist.pdf'
+                )
+                self.assertTrue(content.startswith(b'%PDF'))
+                self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+    def test_unsupported_format(self):
+        response = self.authorized_client.get(self.url + '?format=json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertEqual(
+            response.content.decode(),
+            'Неподдерживаемый формат json. Доступные форматы: txt, csv, pdf.'
+        )
+
+    def test_empty_and_guest(self):
+        ShoppingCart.objects.filter(user=self.user).delete()
+        _, content = self.download('?format=txt')
+        self.assertEqual(content, b'')
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+
+class ConditionalGetTest(ApiTestCase):
+    """ETag выдаётся только при общем для процессов кэше."""
+
+    url = '/api/recipes/?ordering=popular'
+
+    def test_no_etag_with_local_cache(self):
+        response = self.authorized_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    @mock.patch('api.mixins.is_shared_cache', return_value=True)
+    def test_etag_with_shared_cache(self, is_shared_cache):
+        etag = self.authorized_client.get(self.url)['ETag']
+        response = self.authorized_client.get(
+            self.url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        FavoriteRecipe.objects.create(
+            user=self.user, recipe=Recipe.objects.last()
+        )
+        update_recipe_scores()
+        response = self.authorized_client.get(
+            self.url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class FeedTest(ApiTestCase):
+    """Копирование рецептов в ленты подписчиков и порог подписчиков."""
+
+    def setUp(self):
+        super().setUp()
+        # Копии изображений рецептов в этих тестах не нужны.
+        patcher = mock.patch('recipes.signals.schedule_image_processing')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.follower = User.objects.create_user(
+            email='follower@foodgram.ru', username='follower',
+            password='password', first_name='Семён', last_name='Семёнов'
+        )
+        self.follower_client = APIClient()
+        self.follower_client.force_authenticate(self.follower)
+        self.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author',
+            password='password', first_name='Пётр', last_name='Петров'
+        )
+        for i in range(self.recipes_per_author):
+            self.create_recipe(self.author, f'Рецепт автора {i}')
+
+    def subscribe(self, client, author):
+        response = client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def unsubscribe(self, client, author):
+        response = client.delete(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+
+    def get_feed_ids(self, user, author):
+        return set(
+            FeedItem.objects.filter(user=user, author=author).values_list(
+                'recipe_id', flat=True
+            )
+        )
+
+    def get_recipe_ids(self, *authors):
+        return list(
+            Recipe.objects.filter(author__in=authors).order_by(
+                '-pub_date', '-id'
+            ).values_list('id', flat=True)
+        )
+
+    def test_fan_out_on_publish(self):
+        self.subscribe(self.follower_client, self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = self.create_recipe(self.author, 'Новый рецепт')
+        self.assertEqual(
+            self.get_feed_ids(self.follower, self.author),
+            set(self.get_recipe_ids(self.author))
+        )
+        self.assertNotIn(
+            recipe.id, self.get_feed_ids(self.user, self.author)
+        )
+
+    def test_unsubscribe(self):
+        self.subscribe(self.follower_client, self.author)
+        self.assertTrue(self.get_feed_ids(self.follower, self.author))
+        self.unsubscribe(self.follower_client, self.author)
+        self.assertFalse(self.get_feed_ids(self.follower, self.author))
+
+    @mock.patch('recipes.feed.FEED_FANOUT_MAX_FOLLOWERS', 1)
+    def test_fan_out_threshold(self):
+        recipe_ids = self.get_recipe_ids(self.author)
+        self.subscribe(self.follower_client, self.author)
+        self.assertEqual(
+            self.get_feed_ids(self.follower, self.author), set(recipe_ids)
+        )
+        self.subscribe(self.authorized_client, self.author)
+        self.assertFalse(FeedItem.objects.filter(author=self.author))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe(self.author, 'Новый рецепт')
+        self.assertFalse(FeedItem.objects.filter(author=self.author))
+        recipe_ids = self.get_recipe_ids(self.author)
+        self.assertEqual(
+            self.walk('/api/recipes/feed/?limit=2', self.follower_client),
+            recipe_ids
+        )
+        self.unsubscribe(self.authorized_client, self.author)
+        self.assertEqual(
+            self.get_feed_ids(self.follower, self.author), set(recipe_ids)
+        )
+        self.assertEqual(
+            self.walk('/api/recipes/feed/?limit=2', self.follower_client),
+            recipe_ids
+        )
+
+    @mock.patch('recipes.feed.FEED_FANOUT_MAX_FOLLOWERS', 1)
+    def test_feed_cursor(self):
+        heavy_author = self.authors[0]
+        self.subscribe(self.follower_client, self.author)
+        self.subscribe(self.follower_client, heavy_author)
+        with self.captureOnCommitCallbacks(execute=True):
+            for author in (self.author, heavy_author):
+                self.create_recipe(author, f'Новый рецепт {author.username}')
+        self.assertFalse(self.get_feed_ids(self.follower, heavy_author))
+        self.assertEqual(
+            self.walk('/api/recipes/feed/?limit=3', self.follower_client),
+            self.get_recipe_ids(self.author, heavy_author)
+        )
+
+
+def iter_plan_nodes(plan):
+    """Узлы плана запроса PostgreSQL в глубину."""
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from iter_plan_nodes(child)
+
+
+@skipUnless(
+    connection.vendor == 'postgresql',
+    'Планы запросов проверяются только на PostgreSQL'
+)
+class QueryPlanTest(ApiTestCase):
+    """Горячие запросы API читают таблицы по индексам.
+
+    Таблицы заполняются заметным объёмом и по ним собирается статистика.
+    Планы строятся с настройками планировщика по умолчанию и выполняются
+    (EXPLAIN ANALYZE): каждый отфильтрованный запрос должен пройти по
+    ожидаемому индексу, а чтение таблиц не должно отбрасывать фильтром
+    больше max_rows_removed строк. Подсчёт всей ленты читает таблицу
+    целиком без фильтра, и это допустимо.
+    """
+
+    seed_users = 200
+    seed_recipes = 5000
+    seed_tags = 40
+    favorites_per_user = 20
+    cart_per_user = 10
+    max_rows_removed = 100
+    checked_tables = (
+        'recipes_recipe', 'recipes_favoriterecipe',
+        'recipes_shoppingcart', 'recipes_tagsrecipe',
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'Подборка {i}', color=f'#1{i:05d}', slug=f'seed{i}')
+            for i in range(cls.seed_tags)
+        )
+        users = [cls.user] + User.objects.bulk_create(
+            User(
+                email=f'seed{i}@foodgram.ru', username=f'seed{i}',
+                first_name='Семён', last_name='Семёнов'
+            )
+            for i in range(cls.seed_users)
+        )
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=users[i % len(users)], name=f'Рецепт {i}',
+                    image='recipes/image.png', description='Описание',
+                    cooking_time=10
+                )
+                for i in range(cls.seed_recipes)
+            ),
+            batch_size=1000
+        )
+        TagsRecipe.objects.bulk_create(
+            (
+                TagsRecipe(recipe=recipe, tag=tags[(i + shift) % len(tags)])
+                for i, recipe in enumerate(recipes)
+                for shift in (0, 1)
+            ),
+            batch_size=1000
+        )
+        for model, per_user in (
+            (FavoriteRecipe, cls.favorites_per_user),
+            (ShoppingCart, cls.cart_per_user),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(
+                        user=user,
+                        recipe=recipes[(j * 25 + k * 199) % len(recipes)]
+                    )
+                    for j, user in enumerate(users)
+                    for k in range(per_user)
+                ),
+                batch_size=1000
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']
+
+    def assert_plans(self, url, index):
+        """Запросы url используют индекс index и не отбрасывают строки.
+
+        Имена индексов внешних ключей Django дополняет хэшем, поэтому
+        index сравнивается с началом имени.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        used = set()
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            for node in iter_plan_nodes(self.get_plan(sql)):
+                if 'Index Name' in node:
+                    used.add(node['Index Name'])
+                if node.get('Relation Name') not in self.checked_tables:
+                    continue
+                removed = (
+                    node.get('Rows Removed by Filter', 0)
+                    * node['Actual Loops']
+                )
+                self.assertLessEqual(
+                    removed, self.max_rows_removed,
+                    f'{url}: {node["Node Type"]} on '
+                    f'{node["Relation Name"]} removed {removed} rows\n{sql}'
+                )
+        self.assertTrue(
+            any(name.startswith(index) for name in used),
+            f'{url}: {index} not used, used {sorted(used)}'
+        )
+
+    def test_recipe_list(self):
+        self.assert_plans('/api/recipes/', 'recipe_pub_date_id_idx')
+
+    def test_recipe_retrieve(self):
+        recipe = Recipe.objects.filter(author=self.authors[0]).first()
+        self.assert_plans(f'/api/recipes/{recipe.id}/', 'recipes_recipe_pkey')
+
+    def test_recipe_filters(self):
+        for query, index in (
+            (f'author={self.authors[0].id}', 'recipe_author_pub_date_idx'),
+            ('tags=seed5', 'recipes_tagsrecipe_tag_id'),
+            ('tags=seed5&tags=seed17', 'recipes_tagsrecipe_tag_id'),
+            ('is_favorited=1', 'recipes_favoriterecipe_user_id'),
+            ('is_in_shopping_cart=1', 'recipes_shoppingcart_user_id'),
+        ):
+            with self.subTest(query=query):
+                self.assert_plans(f'/api/recipes/?{query}', index)
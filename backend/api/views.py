@@ -1,37 +1,89 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import BooleanField, Exists, F, OuterRef, Prefetch, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.serializers import PrimaryKeyRelatedField, ValidationError
 from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
                                    HTTP_400_BAD_REQUEST)
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.filters import IngredientsFilter, RecipeFilter
-from api.pagination import Pagination
+from api.filters import IngredientsFilter, RecipeFilter, StableOrderingFilter
+from api.mixins import ConditionalGetMixin
+from api.pagination import (CursorPaginationMixin, EstimatedCountPagination,
+                            FeedCursorPagination, Pagination,
+                            RecipeCursorPagination,
+                            SubscriptionCursorPagination)
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (CreateRecipeSerializer, FavoriteRecipeSerializer,
-                             IngredientSerializer, ReadRecipeSerializer,
-                             ShoppingCartSerializer,
-                             SubscriptionCreateSerializer,
-                             SubscriptionSerializer, TagSerializer,
-                             UserSerializer)
-from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingCart, Tag, User)
+from api.renderers import (CSVShoppingCartRenderer, PDFShoppingCartRenderer,
+                           ShoppingCartNegotiation, TextShoppingCartRenderer)
+from api.serializers import (CreateRecipeSerializer, IngredientSerializer,
+                             ReadRecipeSerializer, RecipeIdsSerializer,
+                             ShortCutRecipeSerializer, SubscriptionSerializer,
+                             TagSerializer, UserSerializer,
+                             reset_subscribed_ids)
+from foodgram.constants import (INGREDIENT_AUTOCOMPLETE_LIMIT,
+                                INGREDIENT_FUZZY_LIMIT)
+from recipes.bulk import (add_recipe, add_recipes, delete_row, insert_ignore,
+                          remove_recipe, remove_recipes)
+from recipes.counters import change_counter
+from recipes.deletion import delete_recipes, delete_users
+from recipes.feed import (add_author_to_feed, remove_author_from_feed,
+                          tracking_fanout)
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe, ShoppingCart,
+                            Tag, User)
+from recipes.search import fuzzy_search_ingredients, ingredient_index
+from recipes.versions import (COUNTERS_VERSION_KEY, INGREDIENTS_VERSION_KEY,
+                              RECIPES_VERSION_KEY, SCORES_VERSION_KEY,
+                              TAGS_VERSION_KEY, USERS_VERSION_KEY,
+                              bump_versions, user_state_version_key)
+from users.models import Subscription
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, CursorPaginationMixin, ModelViewSet):
     """Вьюсет рецептов."""
 
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.select_related('author')
+    lookup_value_regex = r'\d+'
+    etag_version_keys = (
+        RECIPES_VERSION_KEY, USERS_VERSION_KEY, TAGS_VERSION_KEY,
+        INGREDIENTS_VERSION_KEY, COUNTERS_VERSION_KEY, SCORES_VERSION_KEY,
+    )
+    etag_user_state = True
     permission_classes = [IsAuthorOrReadOnly, IsAuthenticatedOrReadOnly]
-    pagination_class = Pagination
+    pagination_class = EstimatedCountPagination
+    cursor_pagination_class = RecipeCursorPagination
+    parser_classes = (JSONParser, MultiPartParser)
     filterset_class = RecipeFilter
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, StableOrderingFilter)
+    ordering_fields = (
+        'pub_date', 'favorites_count', 'shopping_cart_count',
+        'popularity_score', 'trending_score',
+    )
+    ordering_aliases = {
+        'popular': '-popularity_score',
+        'trending': '-trending_score',
+    }
+
+    def get_queryset(self):
+        """Аннотирует рецепты флагами избранного и списка покупок."""
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_favorited=Exists(FavoriteRecipe.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+            )
+        return queryset
 
     def get_serializer_class(self):
         """Возвращает сериализатор в зависимости от типа метода."""
@@ -40,31 +92,39 @@ class RecipeViewSet(ModelViewSet):
             return CreateRecipeSerializer
         return ReadRecipeSerializer
 
-    def add_to_base(self, request, serializer, pk):
-        serializer = serializer(
-            data={
-                'user': request.user.id,
-                'recipe': pk
-            },
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+    def perform_destroy(self, instance):
+        delete_recipes(Recipe.objects.filter(pk=instance.pk))
+
+    def add_to_base(self, request, model, pk):
+        """Добавление рецепта одним запросом INSERT без гонок.
+
+        Повторное добавление не вызывает ошибку целостности: конфликт
+        пропускается базой, а ответом служит 400.
+        """
+        recipe = Recipe.objects.filter(pk=pk).first()
+        if recipe is None:
+            raise ValidationError({'recipe': [
+                PrimaryKeyRelatedField.default_error_messages[
+                    'does_not_exist'
+                ].format(pk_value=pk)
+            ]})
+        if not add_recipe(model, request.user, recipe.pk):
+            raise ValidationError({'recipe': ['Уже существует.']})
         return Response(
-            serializer.data,
+            ShortCutRecipeSerializer(
+                recipe, context={'request': request}
+            ).data,
             status=HTTP_201_CREATED,
         )
 
     def delete_from_base(self, user, model, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        database_obj = model.objects.filter(user=user, recipe=recipe)
-        if not database_obj.exists():
-            return Response(
-                {'errors': 'Рецепт не найден в базе.'},
-                status=HTTP_400_BAD_REQUEST
-            )
-        database_obj.delete()
-        return Response(status=HTTP_204_NO_CONTENT)
+        if remove_recipe(model, user, pk):
+            return Response(status=HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
+        return Response(
+            {'errors': 'Рецепт не найден в базе.'},
+            status=HTTP_400_BAD_REQUEST
+        )
 
     @action(
         methods=['post', 'delete'],
@@ -75,7 +135,7 @@ class RecipeViewSet(ModelViewSet):
     def favorite(self, request, pk=None):
         """Экшн для добавления или удаления рецепта из избранного."""
         if request.method == 'POST':
-            return self.add_to_base(request, FavoriteRecipeSerializer, pk)
+            return self.add_to_base(request, FavoriteRecipe, pk)
         return self.delete_from_base(request.user, FavoriteRecipe, pk)
 
     @action(
@@ -87,45 +147,104 @@ class RecipeViewSet(ModelViewSet):
     def shopping_cart(self, request, pk=None):
         """Экшн для добавления или удаления рецепта из списка покупок."""
         if request.method == 'POST':
-            return self.add_to_base(request, ShoppingCartSerializer, pk,)
+            return self.add_to_base(request, ShoppingCart, pk)
         return self.delete_from_base(request.user, ShoppingCart, pk)
 
-    def generate_shopping_cart_list(self, user):
-        """Генерация списка покупок."""
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shop_cart__user=user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(total_sum=Sum('amount'))
-        wishlist = '\n'.join([
-            f'{ingredient["ingredient__name"]}: '
-            f'{ingredient["total_sum"]} '
-            f'{ingredient["ingredient__measurement_unit"]}.'
-            for ingredient in ingredients
-        ])
-        return wishlist
+    def change_many_in_base(self, request, model):
+        """Добавление или удаление нескольких рецептов за один запрос."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        change = add_recipes if request.method == 'POST' else remove_recipes
+        statuses = change(
+            model, request.user, serializer.validated_data['recipes']
+        )
+        return Response({
+            'recipes': [
+                {'id': recipe_id, 'status': status}
+                for recipe_id, status in statuses.items()
+            ]
+        })
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_batch(self, request):
+        """Экшн для добавления или удаления нескольких избранных рецептов."""
+        return self.change_many_in_base(request, FavoriteRecipe)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_batch(self, request):
+        """Экшн для добавления или удаления рецептов из списка покупок."""
+        return self.change_many_in_base(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedCursorPagination,
+        cursor_pagination_class=FeedCursorPagination,
+    )
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь."""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_shopping_cart_ingredients(self, user):
+        """Суммарное количество ингредиентов из списка покупок."""
+        return user.shop_cart_ingredients.values(
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name', 'measurement_unit').iterator()
 
     @action(
         methods=('get',),
         url_path='download_shopping_cart',
         detail=False,
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=(
+            TextShoppingCartRenderer,
+            CSVShoppingCartRenderer,
+            PDFShoppingCartRenderer,
+        ),
+        content_negotiation_class=ShoppingCartNegotiation,
     )
     def download_shopping_cart(self, request):
-        """Экшн для скачивания списка покупок."""
-        wishlist = self.generate_shopping_cart_list(request.user)
+        """Экшн для скачивания списка покупок.
 
-        response = HttpResponse(wishlist, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename=wishlist.txt'
+        Формат файла выбирается параметром ?format=txt|csv|pdf.
+        """
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(self.get_shopping_cart_ingredients(request.user)),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=wishlist.{renderer.format}'
+        )
         return response
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(CursorPaginationMixin, UserViewSet):
     """Вьюсет пользователя."""
 
     queryset = User.objects.all()
+    lookup_value_regex = r'\d+'
     serializer_class = UserSerializer
     pagination_class = Pagination
+    filter_backends = (StableOrderingFilter,)
+    ordering_fields = ('username', 'recipes_count', 'followers_count')
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
     def get_permissions(self):
@@ -133,6 +252,21 @@ class UserViewSet(UserViewSet):
             return (IsAuthenticated(),)
         return super().get_permissions()
 
+    def perform_destroy(self, instance):
+        delete_users(User.objects.filter(pk=instance.pk))
+
+    def get_queryset(self):
+        """Аннотирует пользователей флагом подписки."""
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(Subscription.objects.filter(
+                    user=user, author=OuterRef('pk')
+                ))
+            )
+        return queryset
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -144,37 +278,64 @@ class UserViewSet(UserViewSet):
         return self.delete_subscription(request, id)
 
     def create_subscription(self, request, id):
-        get_object_or_404(User, pk=id)
         user = request.user
-        serializer = SubscriptionCreateSerializer(
-            data={
-                'user': user.id,
-                'author': id
-            },
-            context={'request': request}
+        author = get_object_or_404(User, pk=id)
+        if user == author:
+            raise ValidationError(
+                {'author': ['Нельзя подписаться на себя.']}
+            )
+        with tracking_fanout((author.pk,)):
+            subscribed = insert_ignore(
+                Subscription, user=user.pk, author=author.pk
+            )
+            if subscribed:
+                change_counter(User, 'followers_count', (author.pk,), 1)
+                add_author_to_feed(user.pk, author)
+        if not subscribed:
+            raise ValidationError({'author': ['Уже подписан.']})
+        bump_versions(user_state_version_key(user.pk))
+        reset_subscribed_ids(request)
+        author.refresh_from_db(fields=User.counter_fields)
+        return Response(
+            SubscriptionSerializer(author, context={'request': request}).data,
+            status=HTTP_201_CREATED
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=HTTP_201_CREATED)
 
     def delete_subscription(self, request, id):
         user = request.user
-        author = get_object_or_404(User, pk=id)
-        delete_count, _ = user.follower.filter(author=author).delete()
-        if not delete_count:
-            return Response(
-                {'detail': 'Подписка не найдена.'},
-                status=HTTP_400_BAD_REQUEST
-            )
-        return Response(status=HTTP_204_NO_CONTENT)
+        with tracking_fanout((id,)):
+            unsubscribed = delete_row(Subscription, user=user.pk, author=id)
+            if unsubscribed:
+                change_counter(User, 'followers_count', (id,), -1)
+                remove_author_from_feed(user.pk, id)
+        if unsubscribed:
+            bump_versions(user_state_version_key(user.pk))
+            reset_subscribed_ids(request)
+            return Response(status=HTTP_204_NO_CONTENT)
+        get_object_or_404(User, pk=id)
+        return Response(
+            {'detail': 'Подписка не найдена.'},
+            status=HTTP_400_BAD_REQUEST
+        )
 
     @action(
         detail=False,
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        cursor_pagination_class=SubscriptionCursorPagination,
     )
     def subscriptions(self, request):
         user = request.user
-        follows = User.objects.filter(following__user=user)
+        recipes = Recipe.objects.all()
+        limit = request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            recipes = recipes.filter(pk__in=Recipe.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:int(limit)])
+        follows = self.filter_queryset(
+            User.objects.filter(following__user=user).annotate(
+                is_subscribed=Value(True, output_field=BooleanField()),
+            ).order_by('username')
+        ).prefetch_related(Prefetch('recipes', queryset=recipes))
         page = self.paginate_queryset(follows)
         serializer = SubscriptionSerializer(
             page, many=True,
@@ -183,21 +344,42 @@ class UserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     """Вьюсет тегов."""
 
     queryset = Tag.objects.all()
+    etag_version_keys = (TAGS_VERSION_KEY,)
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     """Вьюсет ингредиентов."""
 
     queryset = Ingredient.objects.all()
+    etag_version_keys = (INGREDIENTS_VERSION_KEY,)
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientsFilter
     pagination_class = None
+
+    def filter_queryset(self, queryset):
+        """Поиск по названию выполняется по индексу в памяти.
+
+        С параметром ?fuzzy=true, а также если по названию ничего
+        не найдено, выполняется нечёткий поиск по сходству триграмм.
+        Ответ содержит не больше INGREDIENT_AUTOCOMPLETE_LIMIT ингредиентов
+        при поиске по названию и INGREDIENT_FUZZY_LIMIT при нечётком поиске.
+        """
+        name = self.request.query_params.get('name')
+        if not name or self.action != 'list':
+            return super().filter_queryset(queryset)
+        if self.request.query_params.get('fuzzy') not in ('1', 'true'):
+            ingredients = ingredient_index.search(
+                name, INGREDIENT_AUTOCOMPLETE_LIMIT
+            )
+            if ingredients:
+                return ingredients
+        return fuzzy_search_ingredients(name, INGREDIENT_FUZZY_LIMIT)
@@ -8,3 +8,26 @@ MAX_NAME_LENGTH_RECIPE = 200
 MIN_VALUE = 1
 MAX_VALUE = 32000
 INGREGIENT_MEASUREMENT_UNIT_NAME_MAX_LENGTH = 200
+COUNT_CACHE_TIMEOUT = 30
+ESTIMATED_COUNT_THRESHOLD = 100000
+RECIPE_SEARCH_CONFIG = 'russian'
+INGREDIENT_AUTOCOMPLETE_LIMIT = 20
+INDEX_VERSION_CHECK_INTERVAL = 2
+INGREDIENT_FUZZY_LIMIT = 20
+INGREDIENT_SIMILARITY_THRESHOLD = 0.3
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+RECIPE_IMAGE_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_CACHE_TIMEOUT = 60 * 60
+MAX_BATCH_RECIPES = 100
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+FEED_BACKFILL_LIMIT = 100
+FAVORITE_SCORE_WEIGHT = 1
+SHOPPING_CART_SCORE_WEIGHT = 2
+POPULARITY_HALF_LIFE_DAYS = 30
+TRENDING_HALF_LIFE_DAYS = 2
+TRENDING_WINDOW_DAYS = 14
@@ -0,0 +1,17 @@
+class CounterFieldsMixin:
+    """Модель со счётчиками, которые меняются только запросами с F().
+
+    При сохранении существующей записи счётчики не записываются,
+    чтобы не затереть их значениями, прочитанными раньше.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
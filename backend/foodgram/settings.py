@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'colorfield',
 
     'rest_framework',
@@ -77,6 +78,23 @@ DATABASES = {
     }
 }
 
+# Версии данных меняют и веб-сервер, и команды управления, поэтому при
+# развёртывании кэш должен быть общим для всех процессов: он задаётся
+# переменными CACHE_BACKEND и CACHE_LOCATION (в docker-compose - memcached),
+# manage.py check --deploy без него завершается ошибкой. Кэш в памяти
+# процесса подходит только для разработки, ETag с ним не выдаются.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.getenv('CACHE_BACKEND'):
+    CACHES['default'] = {
+        'BACKEND': os.getenv('CACHE_BACKEND'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -125,6 +143,10 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media'
 
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -141,3 +163,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6
 }
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_IMAGES_ASYNC = True
+RECIPE_IMAGE_WORKERS = 2
@@ -1,16 +1,22 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.urls import reverse
+from django.utils.text import Truncator
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from recipes.deletion import delete_recipes
 from recipes.models import (
     FavoriteRecipe,
     Ingredient,
     IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
     TagsRecipe
 )
+from recipes.shopping_lists import tracking_recipe_amounts
 
 
 @admin.register(Tag)
@@ -22,10 +28,54 @@ class TagAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+class IngredientRawIdWidget(ForeignKeyRawIdWidget):
+    """Поле id ингредиента с подписями, загруженными заранее."""
+
+    def __init__(self, rel, admin_site, ingredients, **kwargs):
+        super().__init__(rel, admin_site, **kwargs)
+        self.ingredients = ingredients
+
+    def label_and_url_for_value(self, value):
+        ingredient = self.ingredients.get(str(value))
+        if ingredient is None:
+            return super().label_and_url_for_value(value)
+        return Truncator(ingredient).words(14), reverse(
+            f'{self.admin_site.name}:recipes_ingredient_change',
+            args=(ingredient.pk,)
+        )
+
+
 class IngredientRecipeInline(admin.StackedInline):
 
     model = IngredientRecipe
     min_num = 1
+    raw_id_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'ingredient', 'recipe'
+        )
+
+    def get_recipe_ingredients(self, request):
+        """Ингредиенты редактируемого рецепта для подписей полей id."""
+        object_id = request.resolver_match.kwargs.get('object_id', '')
+        if not object_id.isdigit():
+            return {}
+        return {
+            str(ingredient.pk): ingredient
+            for ingredient in Ingredient.objects.filter(
+                ingredient__recipe_id=object_id
+            )
+        }
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = IngredientRawIdWidget(
+                db_field.remote_field, self.admin_site,
+                ingredients=self.get_recipe_ingredients(request),
+                using=kwargs.get('using'),
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 class TagsRecipeInline(admin.StackedInline):
@@ -33,20 +83,46 @@ class TagsRecipeInline(admin.StackedInline):
     model = TagsRecipe
     min_num = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tag', 'recipe')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        """Варианты тегов загружаются один раз для всех форм."""
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'tag':
+            formfield.choices = list(iter(formfield.choices))
+        return formfield
+
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
 
     list_display = (
-        'id', 'name', 'author', 'cooking_time', 'recipe_added_to_favorite'
+        'id', 'name', 'author', 'cooking_time', 'favorites_count',
+        'shopping_cart_count'
     )
-    search_fields = ('id', 'name', 'author')
-    list_filter = ('name', 'author', 'tags')
+    search_fields = ('name', 'author__username')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
+    readonly_fields = (
+        'favorites_count', 'shopping_cart_count',
+        'popularity_score', 'trending_score',
+    )
+    show_full_result_count = False
     inlines = (IngredientRecipeInline, TagsRecipeInline)
 
-    def recipe_added_to_favorite(self, obj):
-        return obj.favorites.count()
-    recipe_added_to_favorite.short_description = 'Добавлен в избранное'
+    def save_related(self, request, form, formsets, change):
+        with tracking_recipe_amounts((form.instance.pk,)):
+            super().save_related(request, form, formsets, change)
+
+    def delete_model(self, request, obj):
+        delete_recipes(Recipe.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_recipes(queryset)
 
 
 class IngredientResource(resources.ModelResource):
@@ -62,28 +138,67 @@ class IngredientAdmin(ImportExportModelAdmin):
     resource_classes = (IngredientResource,)
     list_display = ('id', 'name', 'measurement_unit')
     search_fields = ('name',)
-    list_filter = ('name',)
+    show_full_result_count = False
 
 
 @admin.register(FavoriteRecipe)
 class FavoriteRecipeAdmin(admin.ModelAdmin):
 
     list_display = ('recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    search_fields = ('recipe__name', 'user__username')
+    autocomplete_fields = ('recipe', 'user')
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
 
     list_display = ('recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    search_fields = ('recipe__name', 'user__username')
+    autocomplete_fields = ('recipe', 'user')
+    show_full_result_count = False
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+
+    list_display = ('user', 'ingredient', 'amount')
+    list_select_related = ('user', 'ingredient')
+    search_fields = ('user__username', 'ingredient__name')
+    autocomplete_fields = ('user', 'ingredient')
+    show_full_result_count = False
 
 
 @admin.register(TagsRecipe)
 class TagsRecipeAdmin(admin.ModelAdmin):
 
     list_display = ('recipe', 'tag')
+    list_select_related = ('recipe', 'tag')
+    autocomplete_fields = ('recipe', 'tag')
+    show_full_result_count = False
 
 
 @admin.register(IngredientRecipe)
 class IngredientRecipeAdmin(admin.ModelAdmin):
 
     list_display = ('recipe', 'ingredient')
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        with tracking_recipe_amounts(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with tracking_recipe_amounts((obj.recipe_id,)):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with tracking_recipe_amounts(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
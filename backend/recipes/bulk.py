@@ -0,0 +1,183 @@
+"""Добавление и удаление рецептов в избранном и списке покупок.
+
+Записи добавляются и удаляются одним запросом без сигналов моделей,
+поэтому счётчики рецептов, список покупок и версия отметок пользователя
+обновляются здесь же.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.counters import change_recipe_counter
+from recipes.models import Recipe, ShoppingCart
+from recipes.shopping_lists import apply_amounts, get_recipes_amounts
+from recipes.versions import bump_versions, user_state_version_key
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+NOT_FOUND = 'not_found'
+NOT_IN_LIST = 'not_in_list'
+
+
+def insert_ignore(model, **values):
+    """Добавляет запись, если такой ещё нет.
+
+    Вставка выполняется одним запросом с пропуском конфликта по
+    уникальному ограничению. Возвращает True, если запись добавлена.
+    """
+    quote_name = connection.ops.quote_name
+    columns = ', '.join(
+        quote_name(model._meta.get_field(name).column) for name in values
+    )
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote_name(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) '
+            f'{connection.ops.ignore_conflicts_suffix_sql(True)}',
+            tuple(values.values())
+        )
+        return cursor.rowcount == 1
+
+
+def delete_row(model, **values):
+    """Удаляет запись одним запросом. Возвращает True, если она была."""
+    quote_name = connection.ops.quote_name
+    conditions = ' AND '.join(
+        f'{quote_name(model._meta.get_field(name).column)} = %s'
+        for name in values
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote_name(model._meta.db_table)} '
+            f'WHERE {conditions}',
+            tuple(values.values())
+        )
+        return cursor.rowcount > 0
+
+
+def insert_returning_recipes(model, user_id, recipe_ids):
+    """Добавляет записи пользователя одним запросом.
+
+    Уже существующие записи пропускаются. Возвращает id рецептов,
+    записи о которых действительно добавлены.
+    """
+    if not recipe_ids:
+        return set()
+    quote_name = connection.ops.quote_name
+    values = ', '.join(['(%s, %s, %s)'] * len(recipe_ids))
+    added_at = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote_name(model._meta.db_table)} '
+            f'(user_id, recipe_id, added_at) VALUES {values} '
+            f'{connection.ops.ignore_conflicts_suffix_sql(True)} '
+            f'RETURNING recipe_id',
+            [value for recipe_id in recipe_ids
+             for value in (user_id, recipe_id, added_at)]
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def delete_returning_recipes(model, user_id, recipe_ids):
+    """Удаляет записи пользователя одним запросом.
+
+    Возвращает id рецептов, записи о которых действительно удалены.
+    """
+    if not recipe_ids:
+        return set()
+    quote_name = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote_name(model._meta.db_table)} '
+            f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+            f'RETURNING recipe_id',
+            (user_id, *recipe_ids)
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def update_shopping_list(model, user_id, recipe_ids, sign):
+    if issubclass(model, ShoppingCart) and recipe_ids:
+        amounts = get_recipes_amounts(recipe_ids)
+        apply_amounts(
+            (user_id,),
+            {key: sign * value for key, value in amounts.items()}
+        )
+
+
+def add_recipes(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или список покупок пользователя.
+
+    Возвращает статус для каждого id: added, exists или not_found.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    found = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+    with transaction.atomic():
+        added = insert_returning_recipes(
+            model, user.pk,
+            [recipe_id for recipe_id in recipe_ids if recipe_id in found]
+        )
+        change_recipe_counter(model, added, 1)
+        update_shopping_list(model, user.pk, added, 1)
+    if added:
+        bump_versions(user_state_version_key(user.pk))
+    return {
+        recipe_id: (
+            NOT_FOUND if recipe_id not in found
+            else ADDED if recipe_id in added else EXISTS
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+def remove_recipes(model, user, recipe_ids):
+    """Убирает рецепты из избранного или списка покупок пользователя.
+
+    Возвращает статус для каждого id: removed или not_in_list.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    with transaction.atomic():
+        removed = delete_returning_recipes(model, user.pk, recipe_ids)
+        change_recipe_counter(model, removed, -1)
+        update_shopping_list(model, user.pk, removed, -1)
+    if removed:
+        bump_versions(user_state_version_key(user.pk))
+    return {
+        recipe_id: REMOVED if recipe_id in removed else NOT_IN_LIST
+        for recipe_id in recipe_ids
+    }
+
+
+def change_recipe(model, user, recipe_id, change, sign, **values):
+    with transaction.atomic():
+        changed = change(model, user=user.pk, recipe=recipe_id, **values)
+        if changed:
+            change_recipe_counter(model, (recipe_id,), sign)
+            update_shopping_list(model, user.pk, (recipe_id,), sign)
+    if changed:
+        bump_versions(user_state_version_key(user.pk))
+    return changed
+
+
+def add_recipe(model, user, recipe_id):
+    """Добавляет рецепт в избранное или список покупок пользователя.
+
+    Возвращает False, если рецепт там уже есть.
+    """
+    return change_recipe(
+        model, user, recipe_id, insert_ignore, 1, added_at=timezone.now()
+    )
+
+
+def remove_recipe(model, user, recipe_id):
+    """Убирает рецепт из избранного или списка покупок пользователя.
+
+    Возвращает False, если рецепта там не было.
+    """
+    return change_recipe(model, user, recipe_id, delete_row, -1)
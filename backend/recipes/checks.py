@@ -0,0 +1,18 @@
+"""Проверки настроек для развёртывания."""
+from django.core.checks import Error, Tags, register
+
+from recipes.versions import is_shared_cache
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш версий и представлений должен быть общим для всех процессов."""
+    if is_shared_cache():
+        return []
+    return [Error(
+        'Кэш хранится в памяти процесса: изменения версий из команд '
+        'управления не видны веб-серверу.',
+        hint='Задайте общий кэш переменными окружения CACHE_BACKEND '
+             'и CACHE_LOCATION, например memcached.',
+        id='recipes.E001',
+    )]
@@ -0,0 +1,99 @@
+"""Счётчики избранного, списков покупок, рецептов и подписчиков.
+
+Счётчики меняются запросами UPDATE с F() в тех же транзакциях, что и
+записи, которые они считают. Расхождения исправляет команда
+reconcile_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from recipes.versions import COUNTERS_VERSION_KEY, bump_versions
+from users.models import Subscription, User
+
+RECIPE_COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+# Модель со счётчиком, поле счётчика, считаемая модель и её связь.
+COUNTERS = (
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def change_counter(model, field, ids, delta):
+    """Изменяет счётчик field у записей с id из ids на delta."""
+    if not ids or not delta:
+        return
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    model.objects.filter(pk__in=ids).update(**{field: value})
+    bump_versions(COUNTERS_VERSION_KEY)
+
+
+def subtract_counts(model, field, counted, relation):
+    """Уменьшает счётчик field на число записей counted.
+
+    Все затронутые записи обновляются одним запросом UPDATE.
+    """
+    counts = counted.filter(
+        **{relation: OuterRef('pk')}
+    ).order_by().values(relation).annotate(
+        total=Count('pk')
+    ).values('total')
+    model.objects.filter(pk__in=counted.values(relation)).update(
+        **{field: Greatest(F(field) - Subquery(counts), 0)}
+    )
+    bump_versions(COUNTERS_VERSION_KEY)
+
+
+def change_recipe_counter(model, recipe_ids, delta):
+    """Изменяет счётчик рецептов в избранном или списках покупок."""
+    change_counter(Recipe, RECIPE_COUNTERS[model], recipe_ids, delta)
+
+
+def get_actual_count(counted_model, relation):
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(
+                **{relation: OuterRef('pk')}
+            ).order_by().values(relation).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0
+    )
+
+
+def find_drift(model, field, counted_model, relation):
+    """id записей, у которых счётчик field расходится с данными."""
+    return model.objects.annotate(
+        actual=get_actual_count(counted_model, relation)
+    ).exclude(**{field: F('actual')}).order_by().values_list(
+        'pk', flat=True
+    )
+
+
+def reconcile_counters(fix=True, batch_size=1000):
+    """Сверяет счётчики с данными и при fix исправляет расхождения.
+
+    Возвращает число расхождений для каждого счётчика.
+    """
+    drift = {}
+    for model, field, counted_model, relation in COUNTERS:
+        ids = list(find_drift(model, field, counted_model, relation))
+        drift[f'{model._meta.model_name}.{field}'] = len(ids)
+        if not fix:
+            continue
+        for start in range(0, len(ids), batch_size):
+            model.objects.filter(
+                pk__in=ids[start:start + batch_size]
+            ).update(**{field: get_actual_count(counted_model, relation)})
+    if fix and any(drift.values()):
+        bump_versions(COUNTERS_VERSION_KEY)
+    return drift
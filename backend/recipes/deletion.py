@@ -0,0 +1,90 @@
+"""Удаление рецептов и пользователей вместе со связанными записями.
+
+При каскадном удалении обработчики сигналов избранного, списков покупок
+и подписок меняли бы счётчики и списки покупок запросом на каждую
+строку. Здесь эти изменения делаются несколькими запросами на всё
+удаление, а обработчики строк пропускают записи удаляемых рецептов
+и пользователей.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+from recipes.counters import RECIPE_COUNTERS, subtract_counts
+from recipes.feed import tracking_fanout
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from recipes.shopping_lists import remove_recipes_from_shopping_lists
+from users.models import Subscription, User
+
+deleted = ContextVar('deleted', default=(frozenset(), frozenset()))
+
+
+@contextmanager
+def deleting(recipe_ids=(), user_ids=()):
+    """Отмечает рецепты и пользователей удаляемыми на время блока."""
+    recipes, users = deleted.get()
+    token = deleted.set((recipes | set(recipe_ids), users | set(user_ids)))
+    try:
+        yield
+    finally:
+        deleted.reset(token)
+
+
+def is_recipe_deleted(recipe_id):
+    """Удаляется ли рецепт функциями этого модуля."""
+    return recipe_id in deleted.get()[0]
+
+
+def is_user_deleted(*user_ids):
+    """Удаляется ли кто-то из пользователей функциями этого модуля."""
+    return not deleted.get()[1].isdisjoint(user_ids)
+
+
+def delete_recipes(queryset):
+    """Удаляет рецепты queryset.
+
+    Счётчики рецептов авторов и списки покупок обновляются одним
+    запросом на всё удаление.
+    """
+    with transaction.atomic():
+        recipe_ids = set(queryset.values_list('pk', flat=True))
+        subtract_counts(
+            User, 'recipes_count', Recipe.objects.filter(pk__in=recipe_ids),
+            'author'
+        )
+        remove_recipes_from_shopping_lists(recipe_ids)
+        with deleting(recipe_ids=recipe_ids):
+            return Recipe.objects.filter(pk__in=recipe_ids).delete()
+
+
+def delete_users(queryset):
+    """Удаляет пользователей queryset вместе с их рецептами.
+
+    Счётчики чужих рецептов и авторов и чужие списки покупок
+    обновляются одним запросом на каждый счётчик.
+    """
+    with transaction.atomic():
+        user_ids = set(queryset.values_list('pk', flat=True))
+        recipe_ids = set(
+            Recipe.objects.filter(
+                author_id__in=user_ids
+            ).values_list('pk', flat=True)
+        )
+        remove_recipes_from_shopping_lists(recipe_ids, user_ids)
+        for model in (FavoriteRecipe, ShoppingCart):
+            subtract_counts(
+                Recipe, RECIPE_COUNTERS[model],
+                model.objects.filter(user_id__in=user_ids).exclude(
+                    recipe__author_id__in=user_ids
+                ),
+                'recipe'
+            )
+        subscriptions = Subscription.objects.filter(
+            user_id__in=user_ids
+        ).exclude(author_id__in=user_ids)
+        author_ids = set(subscriptions.values_list('author_id', flat=True))
+        with tracking_fanout(author_ids):
+            subtract_counts(User, 'followers_count', subscriptions, 'author')
+            with deleting(recipe_ids, user_ids):
+                return User.objects.filter(pk__in=user_ids).delete()
@@ -0,0 +1,153 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепт копируется в ленты подписчиков при публикации, а при подписке
+в ленту добавляются последние рецепты автора. Рецепты авторов, у которых
+подписчиков больше FEED_FANOUT_MAX_FOLLOWERS, в ленты не копируются:
+они читаются из таблицы рецептов при запросе ленты. Когда число
+подписчиков автора переходит этот порог, его рецепты переносятся
+между лентами и таблицей рецептов (tracking_fanout).
+"""
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from foodgram.constants import FEED_BACKFILL_LIMIT, FEED_FANOUT_MAX_FOLLOWERS
+from recipes.models import FeedItem, Recipe
+from users.models import Subscription, User
+
+
+def is_fanned_out(author):
+    """Копируются ли рецепты автора в ленты подписчиков."""
+    return author.followers_count <= FEED_FANOUT_MAX_FOLLOWERS
+
+
+def get_fanned_out_ids(author_ids):
+    return set(
+        User.objects.filter(
+            pk__in=author_ids, followers_count__lte=FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('pk', flat=True)
+    )
+
+
+def insert_feed_items(select_sql, params):
+    """Добавляет в ленты строки (user_id, recipe_id, author_id, pub_date).
+
+    Вставка выполняется одним запросом INSERT ... SELECT, уже
+    существующие записи пропускаются.
+    """
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote_name(FeedItem._meta.db_table)} '
+            f'(user_id, recipe_id, author_id, pub_date) {select_sql} '
+            f'{connection.ops.ignore_conflicts_suffix_sql(True)}',
+            params
+        )
+        return cursor.rowcount
+
+
+def fan_out_recipe(recipe):
+    """Добавляет рецепт в ленты подписчиков автора.
+
+    Вызывается после фиксации транзакции, поэтому число подписчиков
+    автора читается из базы, а не из загруженного с рецептом объекта.
+    """
+    if not get_fanned_out_ids((recipe.author_id,)):
+        return 0
+    return insert_feed_items(
+        f'SELECT user_id, %s, %s, %s '
+        f'FROM {connection.ops.quote_name(Subscription._meta.db_table)} '
+        f'WHERE author_id = %s',
+        (recipe.pk, recipe.author_id, recipe.pub_date, recipe.author_id)
+    )
+
+
+def add_author_to_feed(user_id, author):
+    """Добавляет в ленту пользователя последние рецепты автора."""
+    if not is_fanned_out(author):
+        return 0
+    return insert_feed_items(
+        f'SELECT %s, id, author_id, pub_date '
+        f'FROM {connection.ops.quote_name(Recipe._meta.db_table)} '
+        f'WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s',
+        (user_id, author.pk, FEED_BACKFILL_LIMIT)
+    )
+
+
+def add_author_to_followers_feeds(author_id):
+    """Добавляет последние рецепты автора в ленты всех его подписчиков."""
+    quote_name = connection.ops.quote_name
+    return insert_feed_items(
+        f'SELECT subscription.user_id, recipe.id, recipe.author_id, '
+        f'recipe.pub_date '
+        f'FROM {quote_name(Subscription._meta.db_table)} subscription, '
+        f'(SELECT id, author_id, pub_date '
+        f'FROM {quote_name(Recipe._meta.db_table)} '
+        f'WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s) '
+        f'recipe '
+        f'WHERE subscription.author_id = %s',
+        (author_id, FEED_BACKFILL_LIMIT, author_id)
+    )
+
+
+@contextmanager
+def tracking_fanout(author_ids):
+    """Переносит рецепты авторов, у которых в блоке сменился порог.
+
+    Авторам, у которых подписчиков стало не больше
+    FEED_FANOUT_MAX_FOLLOWERS, рецепты добавляются в ленты подписчиков,
+    у остальных - удаляются из лент. Изменения лент самих подписчиков
+    нужно делать внутри блока.
+    """
+    with transaction.atomic():
+        before = get_fanned_out_ids(author_ids)
+        yield
+        after = get_fanned_out_ids(author_ids)
+        for author_id in after - before:
+            add_author_to_followers_feeds(author_id)
+        if before - after:
+            FeedItem.objects.filter(author_id__in=before - after).delete()
+
+
+def remove_author_from_feed(user_id, author_id):
+    """Убирает рецепты автора из ленты пользователя."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def before_position(queryset, position, id_field):
+    if position is None:
+        return queryset
+    pub_date, recipe_id = position
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f'{id_field}__lt': recipe_id})
+    )
+
+
+def get_feed_page(user, position, size):
+    """Рецепты ленты пользователя после позиции position.
+
+    Позиция - пара (дата публикации, id рецепта), рецепты идут от новых
+    к старым. Возвращает не больше size + 1 пар (дата публикации, id):
+    лишняя пара означает, что есть следующая страница.
+    """
+    page = set(
+        before_position(
+            FeedItem.objects.filter(user=user), position, 'recipe_id'
+        ).order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:size + 1]
+    )
+    heavy_authors = Subscription.objects.filter(
+        user=user, author__followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS
+    ).values('author_id')
+    page.update(
+        before_position(
+            Recipe.objects.filter(author__in=heavy_authors), position, 'id'
+        ).order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:size + 1]
+    )
+    return sorted(page, reverse=True)[:size + 1]
@@ -0,0 +1,94 @@
+"""Уменьшенные копии изображений рецептов."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+from foodgram.constants import (RECIPE_IMAGE_FORMATS, RECIPE_IMAGE_QUALITY,
+                                RECIPE_IMAGE_VARIANTS)
+from recipes.models import Recipe
+from recipes.versions import (RECIPES_VERSION_KEY, bump_versions,
+                              recipe_version_key)
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images',
+)
+
+
+def get_variant_name(digest, variant, extension):
+    return f'recipes/variants/{digest[:2]}/{digest}_{variant}.{extension}'
+
+
+def encode_image(image, image_format):
+    buffer = BytesIO()
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(buffer, image_format, quality=RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def build_image_variants(recipe, force=False):
+    """Строит копии изображения рецепта во всех размерах и форматах.
+
+    Имена файлов строятся по хэшу содержимого, поэтому одинаковые
+    изображения обрабатываются и хранятся один раз.
+    """
+    if not recipe.image:
+        return None
+    if not force and recipe.image_variants.get('source') == recipe.image.name:
+        return recipe.image_variants
+    with recipe.image.open('rb') as file:
+        content = file.read()
+    digest = sha256(content).hexdigest()
+    variants = {}
+    with Image.open(BytesIO(content)) as original:
+        original = ImageOps.exif_transpose(original)
+        for variant, size in RECIPE_IMAGE_VARIANTS.items():
+            image = original.copy()
+            image.thumbnail(size)
+            variants[variant] = {}
+            for extension, image_format in RECIPE_IMAGE_FORMATS.items():
+                name = get_variant_name(digest, variant, extension)
+                if not default_storage.exists(name):
+                    name = default_storage.save(
+                        name, ContentFile(encode_image(image, image_format))
+                    )
+                variants[variant][extension] = name
+    image_variants = {'source': recipe.image.name, 'variants': variants}
+    Recipe.objects.filter(
+        pk=recipe.pk, image=recipe.image.name
+    ).update(image_variants=image_variants)
+    bump_versions(recipe_version_key(recipe.pk), RECIPES_VERSION_KEY)
+    recipe.image_variants = image_variants
+    return image_variants
+
+
+def process_recipe_image(recipe_id):
+    """Обработка изображения рецепта в фоновом потоке."""
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is not None:
+            build_image_variants(recipe)
+    except Exception:
+        logger.exception(
+            'Не удалось обработать изображение рецепта %s', recipe_id
+        )
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe_id):
+    """Ставит обработку изображения рецепта в очередь."""
+    if settings.RECIPE_IMAGES_ASYNC:
+        executor.submit(process_recipe_image, recipe_id)
+    else:
+        build_image_variants(Recipe.objects.get(pk=recipe_id))
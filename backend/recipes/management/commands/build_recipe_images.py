@@ -0,0 +1,38 @@
+"""
+Команда для построения уменьшенных копий изображений рецептов.
+"""
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from recipes.images import build_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Построение копий изображений для существующих рецептов."""
+    help = 'Строит уменьшенные копии изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить копии, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_variants'
+        ).order_by('id')
+        failed = 0
+        for recipe in tqdm(
+            recipes.iterator(), total=recipes.count(),
+            desc='Обработка изображений', unit='шт'
+        ):
+            try:
+                build_image_variants(recipe, force=options['force'])
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображения обработаны, ошибок: {failed}'
+        ))
@@ -1,35 +1,103 @@
 """
 Команда для импота ингридиентов в БД.
 """
+import csv
 import json
-from tqdm import tqdm
+import re
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from tqdm import tqdm
 
 from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+CHUNK_SIZE = 64 * 1024
+SEPARATOR_RE = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Построчный разбор JSON-массива объектов без загрузки всего файла."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив')
+    position = 1
+    while True:
+        position = SEPARATOR_RE.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError(f'Некорректный JSON: {error}')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_csv(file):
+    """Разбор CSV-файла со строками вида название,единица."""
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield {'name': name, 'measurement_unit': measurement_unit}
 
 
 class Command(BaseCommand):
     """Команда импорта ингридиентов в базу данных."""
-    help = 'Импорт ингридиентов из файла json'
+    help = 'Импорт ингридиентов из файла json или csv'
 
     BASE_DIR = settings.BASE_DIR
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=Path,
+            default=self.BASE_DIR / 'data/ingredients.json',
+            help='Путь к файлу .json или .csv',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество ингредиентов в одном запросе',
+        )
+
     def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        parse = iter_csv if path.suffix == '.csv' else iter_json_array
         try:
-            path = self.BASE_DIR / 'data/ingredients.json'
-            with open(path, 'r', encoding='utf-8-sig') as file:
-                data = json.load(file)
-                total_items = len(data)
-                with tqdm(
-                    total=total_items,
-                    desc='Импорт ингредиентов',
-                    unit='шт'
-                ) as pbar:
-                    for item in data:
-                        Ingredient.objects.get_or_create(**item)
-                        pbar.update(1)
-        except CommandError as error:
-            raise CommandError from error
-        self.stdout.write(self.style.SUCCESS('Данные успешно загружены'))
+            with open(path, 'r', encoding='utf-8-sig') as file, \
+                    transaction.atomic():
+                count_before = Ingredient.objects.count()
+                total = 0
+                items = iter(tqdm(
+                    parse(file), desc='Импорт ингредиентов', unit='шт'
+                ))
+                while True:
+                    batch = [
+                        Ingredient(**item)
+                        for item in islice(items, batch_size)
+                    ]
+                    if not batch:
+                        break
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True
+                    )
+                    total += len(batch)
+                inserted = Ingredient.objects.count() - count_before
+        except (OSError, ValueError, TypeError) as error:
+            raise CommandError(error) from error
+        ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные успешно загружены. Добавлено: {inserted}, '
+            f'пропущено: {total - inserted}'
+        ))
@@ -0,0 +1,42 @@
+"""
+Команда для пересборки агрегированных списков покупок.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.shopping_lists import (get_expected_amounts, get_stored_amounts,
+                                    rebuild_shopping_lists)
+
+
+class Command(BaseCommand):
+    """Пересборка или проверка таблицы списков покупок."""
+    help = 'Пересобирает списки покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для вставки',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rebuild_shopping_lists(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+            return
+        expected = get_expected_amounts()
+        stored = get_stored_amounts()
+        mismatches = [
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {len(mismatches)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
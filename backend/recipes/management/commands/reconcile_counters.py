@@ -0,0 +1,43 @@
+"""
+Команда для сверки счётчиков рецептов и пользователей.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Исправление или проверка расхождений в счётчиках."""
+    help = (
+        'Сверяет счётчики избранного, списков покупок, рецептов '
+        'и подписчиков с данными и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить расхождения, не изменяя данные',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для обновления',
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(
+            fix=not options['check'], batch_size=options['batch_size']
+        )
+        for counter, count in drift.items():
+            self.stdout.write(f'{counter}: {count}')
+        total = sum(drift.values())
+        if options['check'] and total:
+            raise CommandError(f'Найдено расхождений: {total}')
+        if total:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {total}'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
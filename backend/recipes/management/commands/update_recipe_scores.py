@@ -0,0 +1,33 @@
+"""
+Команда для пересчёта оценок популярности рецептов.
+"""
+from django.core.management.base import BaseCommand
+
+from recipes.scores import update_recipe_scores
+
+
+class Command(BaseCommand):
+    """Пересчёт оценок для сортировок popular и trending.
+
+    Запускается по расписанию, например раз в час из cron.
+    """
+    help = (
+        'Пересчитывает оценки популярности рецептов по добавлениям '
+        'в избранное и списки покупок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пакета для чтения и обновления',
+        )
+
+    def handle(self, *args, **options):
+        scored, reset = update_recipe_scores(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки пересчитаны: {scored}, обнулены: {reset}'
+        ))
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.3 on 2026-10-17 07:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_added_at(apps, schema_editor):
+    """Дата добавления существующих записей неизвестна.
+
+    Вместо неё берётся дата публикации рецепта: без этого все старые
+    добавления получили бы время миграции и считались бы свежими.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    pub_date = Recipe.objects.filter(
+        pk=models.OuterRef('recipe_id')
+    ).values('pub_date')[:1]
+    for model_name in ('FavoriteRecipe', 'ShoppingCart'):
+        apps.get_model('recipes', model_name).objects.update(
+            added_at=models.Subquery(pub_date)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feed_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Набирает популярность'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_added_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity_score', '-id'], name='recipe_popularity_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_score_idx'),
+        ),
+    ]
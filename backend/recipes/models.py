@@ -1,7 +1,9 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db.models import (CASCADE, CharField, DateTimeField, ForeignKey,
-                              ImageField, ManyToManyField, Model,
+from django.db.models import (CASCADE, CharField, DateTimeField, FloatField,
+                              ForeignKey, ImageField, Index, JSONField,
+                              ManyToManyField, Model, PositiveIntegerField,
                               PositiveSmallIntegerField, SlugField, TextField,
                               UniqueConstraint)
 
@@ -9,6 +11,7 @@ from foodgram.constants import (INGREGIENT_MEASUREMENT_UNIT_NAME_MAX_LENGTH,
                                 MAX_NAME_LENGTH_INGREDIENT,
                                 MAX_NAME_LENGTH_RECIPE, MAX_NAME_LENGTH_TAG,
                                 MAX_VALUE, MIN_VALUE)
+from foodgram.mixins import CounterFieldsMixin
 from users.models import User
 
 
@@ -64,7 +67,7 @@ class Ingredient(Model):
         return self.name
 
 
-class Recipe(Model):
+class Recipe(CounterFieldsMixin, Model):
     """Модель рецептов."""
 
     author = ForeignKey(
@@ -81,6 +84,12 @@ class Recipe(Model):
         'Картинка',
         upload_to='recipes/',
     )
+    image_variants = JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     description = TextField(
         'Описание рецепта',
     )
@@ -113,11 +122,67 @@ class Recipe(Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    favorites_count = PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_count = PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    popularity_score = FloatField(
+        'Популярность',
+        default=0,
+        editable=False,
+    )
+    trending_score = FloatField(
+        'Набирает популярность',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = (
+        'favorites_count', 'shopping_cart_count',
+        'popularity_score', 'trending_score',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+            Index(
+                fields=('name',),
+                name='recipe_name_idx'
+            ),
+            Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+            Index(
+                fields=('-popularity_score', '-id'),
+                name='recipe_popularity_score_idx'
+            ),
+            Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_score_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -136,6 +201,10 @@ class FavoritesShopCart(Model):
         verbose_name='Рецепт',
         on_delete=CASCADE
     )
+    added_at = DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+    )
 
     class Meta:
         abstract = True
@@ -193,6 +262,12 @@ class TagsRecipe(Model):
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецепта'
         ordering = ('recipe__name',)
+        indexes = [
+            Index(
+                fields=('tag', 'recipe'),
+                name='tagsrecipe_tag_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.tag.name} - {self.recipe.name}'
@@ -241,3 +316,95 @@ class IngredientRecipe(Model):
 
     def __str__(self):
         return f'{self.ingredient} в {self.recipe}: {self.amount}'
+
+
+class ShoppingCartIngredient(Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Поддерживается инкрементально при изменении списка покупок
+    и ингредиентов рецептов, пересобирается командой
+    rebuild_shopping_lists.
+    """
+
+    user = ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=CASCADE,
+        related_name='shop_cart_ingredients'
+    )
+    ingredient = ForeignKey(
+        Ingredient,
+        verbose_name='Ингредиент',
+        on_delete=CASCADE,
+        related_name='shop_cart_ingredients'
+    )
+    amount = PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        ordering = ('ingredient__name',)
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shop_cart_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} для {self.user}: {self.amount}'
+
+
+class FeedItem(Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Записи добавляются при публикации рецепта и при подписке на автора.
+    Рецепты авторов с большим числом подписчиков в ленты не копируются
+    и читаются при запросе ленты.
+    """
+
+    user = ForeignKey(
+        User,
+        verbose_name='Пользователь',
+        on_delete=CASCADE,
+        related_name='feed_items'
+    )
+    recipe = ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=CASCADE,
+        related_name='feed_items'
+    )
+    author = ForeignKey(
+        User,
+        verbose_name='Автор',
+        on_delete=CASCADE,
+        related_name='+'
+    )
+    pub_date = DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Рецепты в лентах'
+        ordering = ('-pub_date', '-recipe')
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item')
+        ]
+        indexes = [
+            Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_item_user_pub_date_idx'
+            ),
+            Index(
+                fields=('user', 'author'),
+                name='feed_item_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
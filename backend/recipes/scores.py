@@ -0,0 +1,84 @@
+"""Оценки популярности рецептов для сортировок popular и trending.
+
+Оценка - сумма добавлений в избранное и списки покупок с весами,
+вклад каждого добавления уменьшается вдвое за период полураспада.
+Оценки пересчитываются командой update_recipe_scores и хранятся в полях
+рецепта, поэтому сортировка по ним - проход по индексу.
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from foodgram.constants import (FAVORITE_SCORE_WEIGHT,
+                                POPULARITY_HALF_LIFE_DAYS,
+                                SHOPPING_CART_SCORE_WEIGHT,
+                                TRENDING_HALF_LIFE_DAYS, TRENDING_WINDOW_DAYS)
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+from recipes.versions import SCORES_VERSION_KEY, bump_versions
+
+SCORE_WEIGHTS = (
+    (FavoriteRecipe, FAVORITE_SCORE_WEIGHT),
+    (ShoppingCart, SHOPPING_CART_SCORE_WEIGHT),
+)
+SCORE_FIELDS = ('popularity_score', 'trending_score')
+
+
+def decay(age, half_life_days):
+    return 0.5 ** (age / timedelta(days=half_life_days))
+
+
+def iter_batches(model, batch_size):
+    """Добавления рецептов пакетами по batch_size в порядке id."""
+    last_pk = 0
+    while True:
+        batch = list(
+            model.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', 'recipe_id', 'added_at'
+            )[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def compute_scores(now, batch_size=1000):
+    """Оценки popularity_score и trending_score рецептов на момент now.
+
+    Рецепты без добавлений в результат не попадают.
+    """
+    window = timedelta(days=TRENDING_WINDOW_DAYS)
+    scores = {}
+    for model, weight in SCORE_WEIGHTS:
+        for batch in iter_batches(model, batch_size):
+            for _, recipe_id, added_at in batch:
+                age = max(now - added_at, timedelta())
+                score = scores.setdefault(recipe_id, [0, 0])
+                score[0] += weight * decay(age, POPULARITY_HALF_LIFE_DAYS)
+                if age <= window:
+                    score[1] += weight * decay(age, TRENDING_HALF_LIFE_DAYS)
+    return scores
+
+
+def update_recipe_scores(batch_size=1000, now=None):
+    """Пересчитывает оценки рецептов и записывает их пакетами.
+
+    Возвращает число рецептов с новыми оценками и число рецептов,
+    оценки которых обнулены.
+    """
+    scores = compute_scores(now or timezone.now(), batch_size)
+    stale = set(
+        Recipe.objects.filter(
+            Q(popularity_score__gt=0) | Q(trending_score__gt=0)
+        ).values_list('pk', flat=True)
+    ).difference(scores)
+    recipes = [
+        Recipe(pk=pk, popularity_score=popularity, trending_score=trending)
+        for pk, (popularity, trending) in scores.items()
+    ] + [
+        Recipe(pk=pk, popularity_score=0, trending_score=0) for pk in stale
+    ]
+    Recipe.objects.bulk_update(recipes, SCORE_FIELDS, batch_size=batch_size)
+    bump_versions(SCORES_VERSION_KEY)
+    return len(scores), len(stale)
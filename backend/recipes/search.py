@@ -0,0 +1,268 @@
+"""Поисковые индексы в памяти процесса."""
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+from threading import Lock
+from time import monotonic
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from foodgram.constants import (INDEX_VERSION_CHECK_INTERVAL,
+                                INGREDIENT_AUTOCOMPLETE_LIMIT,
+                                INGREDIENT_FUZZY_LIMIT,
+                                INGREDIENT_SIMILARITY_THRESHOLD,
+                                RECIPE_SEARCH_CONFIG)
+from recipes.models import Ingredient, Recipe
+from recipes.versions import (INGREDIENTS_VERSION_KEY, RECIPES_VERSION_KEY,
+                              bump_versions, get_version)
+
+RECIPE_NAME_WEIGHT = 2
+RECIPE_DESCRIPTION_WEIGHT = 1
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре."""
+    return WORD_RE.findall(text.casefold())
+
+
+def trigrams(text):
+    """Триграммы строки по правилам pg_trgm."""
+    result = set()
+    for word in tokenize(text):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+def prefix_range(keys, prefix):
+    """Границы ключей отсортированного списка, начинающихся с prefix."""
+    start = end = bisect_left(keys, prefix)
+    while end < len(keys) and keys[end].startswith(prefix):
+        end += 1
+    return start, end
+
+
+class VersionedIndex:
+    """Индекс, который строится лениво и сбрасывается по версии.
+
+    Версия хранится в кэше, поэтому её изменение видят все процессы,
+    использующие общий кэш. Кэш читается не чаще раза в
+    INDEX_VERSION_CHECK_INTERVAL секунд, изменения из других процессов
+    видны с этой задержкой.
+    """
+
+    version_key = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._data = None
+        self._checked_at = None
+
+    def get_version(self):
+        return get_version(self.version_key)
+
+    def invalidate(self):
+        """Сообщает всем процессам, что индекс устарел."""
+        bump_versions(self.version_key)
+        self._checked_at = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get_data(self):
+        """Возвращает актуальные данные индекса."""
+        now = monotonic()
+        if (
+            self._checked_at is not None
+            and now - self._checked_at < INDEX_VERSION_CHECK_INTERVAL
+        ):
+            return self._data
+        version = self.get_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._data = self.build()
+                    self._version = version
+        self._checked_at = now
+        return self._data
+
+
+class IngredientPrefixIndex(VersionedIndex):
+    """Индекс названий ингредиентов для автодополнения.
+
+    Названия хранятся в отсортированном списке в нижнем регистре
+    (casefold), префиксный поиск выполняется бинарным поиском.
+    Для нечёткого поиска строится индекс триграмм названий.
+    """
+
+    version_key = INGREDIENTS_VERSION_KEY
+
+    def build(self):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda item: (item.name.casefold(), item.measurement_unit)
+        )
+        names = [item.name.casefold() for item in ingredients]
+        name_trigrams = [trigrams(name) for name in names]
+        postings = defaultdict(list)
+        for position, grams in enumerate(name_trigrams):
+            for gram in grams:
+                postings[gram].append(position)
+        return names, ingredients, name_trigrams, dict(postings)
+
+    def search(self, query, limit=INGREDIENT_AUTOCOMPLETE_LIMIT):
+        """Не больше limit ингредиентов: сначала начинающиеся с query,
+        затем содержащие его.
+        """
+        names, ingredients, _, _ = self.get_data()
+        query = query.casefold()
+        start, end = prefix_range(names, query)
+        result = ingredients[start:min(end, start + limit)]
+        result.extend(islice(
+            (
+                ingredient
+                for name, ingredient in zip(names, ingredients)
+                if query in name and not name.startswith(query)
+            ),
+            limit - len(result)
+        ))
+        return result
+
+    def fuzzy_search(self, query, limit=INGREDIENT_FUZZY_LIMIT):
+        """Ингредиенты, похожие на query, по убыванию сходства."""
+        _, ingredients, name_trigrams, postings = self.get_data()
+        query_trigrams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in query_trigrams:
+            for position in postings.get(gram, ()):
+                shared[position] += 1
+        similarities = []
+        for position, count in shared.items():
+            similarity = count / (
+                len(query_trigrams) + len(name_trigrams[position]) - count
+            )
+            if similarity >= INGREDIENT_SIMILARITY_THRESHOLD:
+                similarities.append((-similarity, position))
+        similarities.sort()
+        return [ingredients[position] for _, position in similarities[:limit]]
+
+
+class RecipeInvertedIndex(VersionedIndex):
+    """Инвертированный индекс слов названия и описания рецептов.
+
+    Используется для поиска, когда база данных не PostgreSQL.
+    """
+
+    version_key = RECIPES_VERSION_KEY
+
+    def build(self):
+        postings = defaultdict(lambda: defaultdict(int))
+        recipes = Recipe.objects.values_list(
+            'id', 'name', 'description'
+        ).order_by().iterator()
+        for recipe_id, name, description in recipes:
+            for word in tokenize(name):
+                postings[word][recipe_id] += RECIPE_NAME_WEIGHT
+            for word in tokenize(description):
+                postings[word][recipe_id] += RECIPE_DESCRIPTION_WEIGHT
+        words = sorted(postings)
+        return words, [dict(postings[word]) for word in words]
+
+    def search(self, query):
+        """Веса рецептов, содержащих все слова запроса, по id рецепта."""
+        words, postings = self.get_data()
+        scores = None
+        for term in tokenize(query):
+            start, end = prefix_range(words, term)
+            term_scores = defaultdict(int)
+            for posting in postings[start:end]:
+                for recipe_id, weight in posting.items():
+                    term_scores[recipe_id] += weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    recipe_id: score + term_scores[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in term_scores
+                }
+        return scores or {}
+
+
+def has_trigram_extension(connection):
+    """Установлено ли в базе расширение pg_trgm."""
+    if connection.vendor != 'postgresql':
+        return False
+    if not hasattr(connection, 'has_trigram_extension'):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            connection.has_trigram_extension = cursor.fetchone() is not None
+    return connection.has_trigram_extension
+
+
+def fuzzy_search_ingredients(query, limit=INGREDIENT_FUZZY_LIMIT):
+    """Нечёткий поиск ингредиентов по сходству триграмм.
+
+    На PostgreSQL с pg_trgm используется GIN-индекс, иначе индекс
+    триграмм в памяти процесса. В обоих случаях возвращается не больше
+    limit ингредиентов со сходством не ниже INGREDIENT_SIMILARITY_THRESHOLD:
+    для оператора % порог задаётся на время транзакции.
+    """
+    queryset = Ingredient.objects.all()
+    connection = connections[queryset.db]
+    if not has_trigram_extension(connection):
+        return ingredient_index.fuzzy_search(query, limit)
+    with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+        cursor.execute(
+            'SET LOCAL pg_trgm.similarity_threshold = %s',
+            [INGREDIENT_SIMILARITY_THRESHOLD]
+        )
+        return list(queryset.filter(name__trigram_similar=query).annotate(
+            similarity=TrigramSimilarity('name', query)
+        ).order_by('-similarity', 'name')[:limit])
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск рецептов с сортировкой по релевантности.
+
+    Слова запроса ищутся как начала слов рецепта, рецепты с равной
+    релевантностью идут от новых к старым.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset.none()
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            config=RECIPE_SEARCH_CONFIG, search_type='raw'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date', '-id')
+    scores = recipe_index.search(query)
+    if not scores:
+        return queryset.none()
+    recipe_ids = defaultdict(list)
+    for recipe_id, score in scores.items():
+        recipe_ids[score].append(recipe_id)
+    return queryset.filter(pk__in=scores).annotate(
+        rank=Case(
+            *(
+                When(pk__in=ids, then=Value(score))
+                for score, ids in recipe_ids.items()
+            ),
+            output_field=IntegerField(),
+        )
+    ).order_by('-rank', '-pub_date', '-id')
+
+
+ingredient_index = IngredientPrefixIndex()
+recipe_index = RecipeInvertedIndex()
@@ -0,0 +1,203 @@
+"""Поддержка агрегированных списков покупок."""
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef,
+                              Subquery, Sum, Value, When)
+from django.db.models.functions import Greatest
+
+from recipes.models import (IngredientRecipe, ShoppingCart,
+                            ShoppingCartIngredient)
+
+
+def get_recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return Counter(dict(
+        IngredientRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount')
+    ))
+
+
+def get_recipes_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    return Counter(dict(
+        IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total')
+    ))
+
+
+def upsert_amounts(user_ids, amounts, batch_size=1000):
+    """Прибавляет положительные amounts запросами по batch_size строк.
+
+    Отсутствующие строки вставляются, существующие увеличиваются через
+    INSERT ... ON CONFLICT (user_id, ingredient_id) DO UPDATE, поэтому
+    одновременные добавления не конфликтуют по уникальному ограничению.
+    """
+    table = connection.ops.quote_name(ShoppingCartIngredient._meta.db_table)
+    rows = [
+        (user_id, ingredient_id, amount)
+        for user_id in user_ids
+        for ingredient_id, amount in amounts.items()
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {table}.amount + EXCLUDED.amount',
+                [value for row in batch for value in row]
+            )
+
+
+def subtract_amounts(user_ids, amounts):
+    """Уменьшает итоги на amounts и удаляет обнулившиеся строки."""
+    queryset = ShoppingCartIngredient.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=amounts
+    )
+    queryset.update(amount=Greatest(
+        F('amount') - Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in amounts.items()
+            ),
+            output_field=IntegerField(),
+        ),
+        0
+    ))
+    queryset.filter(amount=0).delete()
+
+
+def apply_amounts(user_ids, amounts):
+    """Прибавляет amounts к спискам покупок пользователей.
+
+    amounts сопоставляет id ингредиента и изменение количества,
+    отрицательные значения уменьшают итог.
+    """
+    user_ids = set(user_ids)
+    added = {key: value for key, value in amounts.items() if value > 0}
+    removed = {key: -value for key, value in amounts.items() if value < 0}
+    if not user_ids or not (added or removed):
+        return
+    with transaction.atomic():
+        if added:
+            upsert_amounts(user_ids, added)
+        if removed:
+            subtract_amounts(user_ids, removed)
+
+
+def add_to_shopping_lists(user_ids, recipe):
+    """Добавляет ингредиенты рецепта в списки покупок."""
+    apply_amounts(user_ids, get_recipe_amounts(recipe))
+
+
+def remove_from_shopping_lists(user_ids, recipe):
+    """Убирает ингредиенты рецепта из списков покупок."""
+    amounts = get_recipe_amounts(recipe)
+    apply_amounts(user_ids, {key: -value for key, value in amounts.items()})
+
+
+def remove_recipes_from_shopping_lists(recipe_ids, exclude_user_ids=()):
+    """Убирает ингредиенты рецептов из списков покупок всех пользователей.
+
+    Итоги уменьшаются одним запросом UPDATE, обнулившиеся строки
+    удаляются. Списки пользователей exclude_user_ids не меняются.
+    """
+    removed = IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids,
+        recipe__shop_cart__user=OuterRef('user'),
+        ingredient=OuterRef('ingredient'),
+    ).order_by().values('ingredient').annotate(
+        total=Sum('amount')
+    ).values('total')
+    queryset = ShoppingCartIngredient.objects.filter(Exists(removed)).exclude(
+        user_id__in=exclude_user_ids
+    )
+    queryset.update(amount=Greatest(F('amount') - Subquery(removed), 0))
+    queryset.filter(amount=0).delete()
+
+
+def update_shopping_lists(recipe, old_amounts):
+    """Учитывает изменение ингредиентов рецепта в списках покупок."""
+    amounts = get_recipe_amounts(recipe)
+    amounts.subtract(old_amounts)
+    apply_amounts(
+        ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True),
+        amounts
+    )
+
+
+@contextmanager
+def tracking_recipe_amounts(recipe_ids):
+    """Учитывает в списках покупок изменения ингредиентов рецептов в блоке.
+
+    Для записей ингредиентов, сохранённых через ORM, например в админке:
+    до блока запоминаются количества, после него в списки покупок
+    переносится разница.
+    """
+    with transaction.atomic():
+        old_amounts = {
+            recipe_id: get_recipe_amounts(recipe_id)
+            for recipe_id in set(recipe_ids)
+        }
+        yield
+        for recipe_id, amounts in old_amounts.items():
+            update_shopping_lists(recipe_id, amounts)
+
+
+def get_expected_amounts(user_ids=None):
+    """Итоги списков покупок, посчитанные заново по корзинам."""
+    # Условия на корзину задаются одним filter(): второй вызов filter()
+    # по связи «многие» добавил бы ещё одно соединение с корзинами.
+    conditions = {'recipe__shop_cart__isnull': False}
+    if user_ids is not None:
+        conditions['recipe__shop_cart__user_id__in'] = user_ids
+    queryset = IngredientRecipe.objects.filter(**conditions)
+    return {
+        (item['recipe__shop_cart__user'], item['ingredient']): item['total']
+        for item in queryset.values(
+            'recipe__shop_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by().iterator()
+    }
+
+
+def get_stored_amounts(user_ids=None):
+    """Итоги списков покупок, сохранённые в таблице."""
+    queryset = ShoppingCartIngredient.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ).order_by().iterator()
+    }
+
+
+def rebuild_shopping_lists(user_ids=None, batch_size=1000):
+    """Пересобирает таблицу списков покупок с нуля."""
+    with transaction.atomic():
+        queryset = ShoppingCartIngredient.objects.all()
+        if user_ids is not None:
+            queryset = queryset.filter(user_id__in=user_ids)
+        queryset.delete()
+        ShoppingCartIngredient.objects.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for (user_id, ingredient_id), amount
+                in get_expected_amounts(user_ids).items()
+            ),
+            batch_size=batch_size
+        )
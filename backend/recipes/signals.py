@@ -0,0 +1,191 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.counters import change_counter, change_recipe_counter
+from recipes.deletion import is_recipe_deleted, is_user_deleted
+from recipes.feed import (add_author_to_feed, fan_out_recipe,
+                          remove_author_from_feed, tracking_fanout)
+from recipes.images import schedule_image_processing
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, Tag, TagsRecipe)
+from recipes.search import ingredient_index, recipe_index
+from recipes.shopping_lists import (add_to_shopping_lists,
+                                    remove_from_shopping_lists)
+from recipes.versions import (TAGS_VERSION_KEY, USERS_VERSION_KEY,
+                              bump_versions, recipe_version_key,
+                              user_state_version_key, user_version_key)
+from users.models import Subscription, User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """Сброс индекса ингредиентов при изменении таблицы."""
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_index(**kwargs):
+    """Сброс поискового индекса рецептов при изменении таблицы."""
+    recipe_index.invalidate()
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(instance, created, **kwargs):
+    """Добавление ингредиентов рецепта в список покупок."""
+    if created:
+        add_to_shopping_lists((instance.user_id,), instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(instance, **kwargs):
+    """Удаление ингредиентов рецепта из списка покупок."""
+    if is_recipe_deleted(instance.recipe_id) or is_user_deleted(
+        instance.user_id
+    ):
+        return
+    remove_from_shopping_lists((instance.user_id,), instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, **kwargs):
+    """Построение копий изображения после сохранения рецепта."""
+    if (
+        instance.image
+        and instance.image_variants.get('source') != instance.image.name
+    ):
+        transaction.on_commit(
+            lambda: schedule_image_processing(instance.pk)
+        )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipe_version(instance, **kwargs):
+    """Сброс кэша представления рецепта."""
+    bump_versions(recipe_version_key(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=TagsRecipe)
+def bump_related_recipe_version(instance, **kwargs):
+    """Сброс кэша рецепта при изменении его ингредиентов или тегов."""
+    if is_recipe_deleted(instance.recipe_id):
+        return
+    bump_versions(recipe_version_key(instance.recipe_id))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    """Сброс кэша рецептов при изменении тегов."""
+    bump_versions(TAGS_VERSION_KEY)
+
+
+@receiver(post_save, sender=User)
+def bump_user_version(instance, update_fields=None, **kwargs):
+    """Сброс кэша рецептов автора при изменении его данных."""
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_versions(user_version_key(instance.pk), USERS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=FavoriteRecipe)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscription)
+def bump_user_state_version(instance, **kwargs):
+    """Сброс ETag ответов пользователя при изменении его отметок.
+
+    При удалении рецептов и пользователей ETag сбрасывается версией
+    рецептов.
+    """
+    if is_user_deleted(instance.user_id) or is_recipe_deleted(
+        getattr(instance, 'recipe_id', None)
+    ):
+        return
+    bump_versions(user_state_version_key(instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(instance, created, **kwargs):
+    """Увеличение счётчика рецептов автора."""
+    if created:
+        change_counter(User, 'recipes_count', (instance.author_id,), 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(instance, **kwargs):
+    """Уменьшение счётчика рецептов автора."""
+    if is_recipe_deleted(instance.pk):
+        return
+    change_counter(User, 'recipes_count', (instance.author_id,), -1)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def increase_recipe_counter(sender, instance, created, **kwargs):
+    """Увеличение счётчика избранного или списков покупок рецепта."""
+    if created:
+        change_recipe_counter(sender, (instance.recipe_id,), 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def decrease_recipe_counter(sender, instance, **kwargs):
+    """Уменьшение счётчика избранного или списков покупок рецепта."""
+    if is_recipe_deleted(instance.recipe_id) or is_user_deleted(
+        instance.user_id
+    ):
+        return
+    change_recipe_counter(sender, (instance.recipe_id,), -1)
+
+
+@receiver(pre_save, sender=FavoriteRecipe)
+@receiver(pre_save, sender=ShoppingCart)
+def move_recipe_mark(sender, instance, **kwargs):
+    """Перенос отметки на другой рецепт или пользователя, например в админке.
+
+    Счётчики рецептов и список покупок обновляются для прежней
+    и новой пары пользователь-рецепт.
+    """
+    if instance.pk is None:
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'recipe_id'
+    ).first()
+    if old is None or old == (instance.user_id, instance.recipe_id):
+        return
+    old_user_id, old_recipe_id = old
+    if old_recipe_id != instance.recipe_id:
+        change_recipe_counter(sender, (old_recipe_id,), -1)
+        change_recipe_counter(sender, (instance.recipe_id,), 1)
+    if issubclass(sender, ShoppingCart):
+        remove_from_shopping_lists((old_user_id,), old_recipe_id)
+        add_to_shopping_lists((instance.user_id,), instance.recipe_id)
+    bump_versions(user_state_version_key(old_user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def add_recipe_to_feeds(instance, created, **kwargs):
+    """Добавление нового рецепта в ленты подписчиков автора."""
+    if created:
+        transaction.on_commit(lambda: fan_out_recipe(instance))
+
+
+@receiver(post_save, sender=Subscription)
+def add_subscription(instance, created, **kwargs):
+    """Увеличение счётчика подписчиков и добавление рецептов в ленту."""
+    if not created:
+        return
+    with tracking_fanout((instance.author_id,)):
+        change_counter(User, 'followers_count', (instance.author_id,), 1)
+        add_author_to_feed(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Subscription)
+def remove_subscription(instance, **kwargs):
+    """Уменьшение счётчика подписчиков и удаление рецептов из ленты."""
+    if is_user_deleted(instance.user_id, instance.author_id):
+        return
+    with tracking_fanout((instance.author_id,)):
+        change_counter(User, 'followers_count', (instance.author_id,), -1)
+        remove_author_from_feed(instance.user_id, instance.author_id)
@@ -0,0 +1,410 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes.counters import reconcile_counters
+from recipes.deletion import delete_recipes, delete_users
+from recipes.management.commands.load_ingredients import iter_json_array
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingCart, Tag, TagsRecipe)
+from recipes.shopping_lists import (apply_amounts, get_expected_amounts,
+                                    get_stored_amounts)
+from users.models import Subscription, User
+
+
+class AdminQueryCountTest(TestCase):
+    """Число запросов страниц админки не зависит от числа строк."""
+
+    rows = 20
+    # Сессия, пользователь, количество строк и строки страницы,
+    # у рецептов ещё теги для фильтра.
+    CHANGELIST_QUERIES = 4
+    RECIPE_CHANGELIST_QUERIES = 5
+    # Формсеты строятся трижды: подписи ингредиентов и варианты тегов
+    # загружаются на каждый формсет, а не на каждую форму.
+    RECIPE_CHANGE_QUERIES = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@foodgram.ru', username='admin', password='password',
+            first_name='Админ', last_name='Админов'
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        for i in range(cls.rows):
+            author = User.objects.create_user(
+                email=f'author{i}@foodgram.ru', username=f'author{i}',
+                password='password', first_name='Пётр', last_name='Петров'
+            )
+            cls.recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {i}', image='recipes/image.png',
+                description='Описание', cooking_time=10
+            )
+            for ingredient in ingredients:
+                IngredientRecipe.objects.create(
+                    recipe=cls.recipe, ingredient=ingredient, amount=5
+                )
+            for tag in tags:
+                TagsRecipe.objects.create(recipe=cls.recipe, tag=tag)
+            FavoriteRecipe.objects.create(user=cls.admin, recipe=cls.recipe)
+            ShoppingCart.objects.create(user=author, recipe=cls.recipe)
+
+    def setUp(self):
+        ContentType.objects.clear_cache()
+        self.client.force_login(self.admin)
+
+    def assert_page_queries(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_recipe_changelist(self):
+        self.assert_page_queries(
+            '/admin/recipes/recipe/', self.RECIPE_CHANGELIST_QUERIES
+        )
+
+    def test_changelists(self):
+        for url in (
+            '/admin/recipes/favoriterecipe/',
+            '/admin/recipes/shoppingcart/',
+            '/admin/recipes/tagsrecipe/',
+        ):
+            with self.subTest(url=url):
+                self.assert_page_queries(url, self.CHANGELIST_QUERIES)
+
+    def test_recipe_change(self):
+        response = self.assert_page_queries(
+            f'/admin/recipes/recipe/{self.recipe.id}/change/',
+            self.RECIPE_CHANGE_QUERIES
+        )
+        self.assertContains(response, '>Ингредиент 4</a></strong>')
+
+    def test_recipe_add(self):
+        response = self.client.get('/admin/recipes/recipe/add/')
+        self.assertEqual(response.status_code, 200)
+
+
+class ShoppingListTest(TestCase):
+    """Итоги списков покупок совпадают с пересчётом по корзинам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{i}@foodgram.ru', username=f'user{i}',
+                password='password', first_name='Иван', last_name='Иванов'
+            )
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(2)
+        ]
+        cls.recipes = []
+        for i in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.users[0], name=f'Рецепт {i}',
+                image='recipes/image.png', description='Описание',
+                cooking_time=10
+            )
+            for ingredient in cls.ingredients:
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=5
+                )
+            cls.recipes.append(recipe)
+        cls.extra_ingredient = Ingredient.objects.create(
+            name='Ингредиент вне рецептов', measurement_unit='г'
+        )
+        cls.admin = User.objects.create_superuser(
+            email='admin@foodgram.ru', username='admin', password='password',
+            first_name='Админ', last_name='Админов'
+        )
+
+    def create_recipe(self, name):
+        recipe = Recipe.objects.create(
+            author=self.users[0], name=name, image='recipes/image.png',
+            description='Описание', cooking_time=10
+        )
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=self.extra_ingredient, amount=2
+        )
+        return recipe
+
+    def fill_carts(self):
+        for user in self.users:
+            for recipe in self.recipes:
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def test_expected_amounts(self):
+        self.fill_carts()
+        user = self.users[1]
+        expected = {
+            (user.id, ingredient.id): 10 for ingredient in self.ingredients
+        }
+        self.assertEqual(get_expected_amounts((user.id,)), expected)
+        self.assertEqual(get_stored_amounts((user.id,)), expected)
+        self.assertEqual(get_expected_amounts(), get_stored_amounts())
+
+    def test_apply_amounts(self):
+        self.fill_carts()
+        ShoppingCart.objects.filter(
+            user=self.users[0], recipe=self.recipes[0]
+        ).delete()
+        self.assertEqual(get_stored_amounts(), get_expected_amounts())
+        ShoppingCart.objects.filter(user=self.users[0]).delete()
+        self.assertEqual(get_stored_amounts(), get_expected_amounts())
+        self.assertFalse(get_stored_amounts((self.users[0].id,)))
+        user_ids = [user.id for user in self.users]
+        ingredient = self.ingredients[0]
+        apply_amounts(user_ids, {ingredient.id: 3})
+        self.assertEqual(get_stored_amounts((self.users[0].id,)), {
+            (self.users[0].id, ingredient.id): 3
+        })
+        apply_amounts(user_ids, {ingredient.id: -13})
+        self.assertFalse(get_stored_amounts((self.users[0].id,)))
+        self.assertEqual(get_stored_amounts((self.users[1].id,)), {
+            (self.users[1].id, self.ingredients[1].id): 10
+        })
+
+    def assert_consistent(self):
+        self.assertEqual(get_stored_amounts(), get_expected_amounts())
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+
+    def test_admin_recipe_inline(self):
+        self.fill_carts()
+        self.client.force_login(self.admin)
+        recipe = self.recipes[0]
+        items = IngredientRecipe.objects.filter(recipe=recipe).order_by('pk')
+        data = {
+            'name': recipe.name, 'author': recipe.author_id,
+            'cooking_time': recipe.cooking_time,
+            'description': recipe.description,
+            'recipe-TOTAL_FORMS': 3, 'recipe-INITIAL_FORMS': 2,
+            'recipe-MIN_NUM_FORMS': 0, 'recipe-MAX_NUM_FORMS': 1000,
+            'tagsrecipe_set-TOTAL_FORMS': 0,
+            'tagsrecipe_set-INITIAL_FORMS': 0,
+            'tagsrecipe_set-MIN_NUM_FORMS': 0,
+            'tagsrecipe_set-MAX_NUM_FORMS': 1000,
+        }
+        for i, (item, amount) in enumerate(zip(items, (50, 5))):
+            data.update({
+                f'recipe-{i}-id': item.pk, f'recipe-{i}-recipe': recipe.pk,
+                f'recipe-{i}-ingredient': item.ingredient_id,
+                f'recipe-{i}-amount': amount,
+            })
+        data.update({
+            'recipe-2-recipe': recipe.pk,
+            'recipe-2-ingredient': self.extra_ingredient.pk,
+            'recipe-2-amount': 7,
+        })
+        response = self.client.post(
+            f'/admin/recipes/recipe/{recipe.pk}/change/', data
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            get_stored_amounts((self.users[0].id,))[
+                (self.users[0].id, self.extra_ingredient.pk)
+            ],
+            7
+        )
+        self.assert_consistent()
+
+    def test_admin_ingredient_recipe(self):
+        self.fill_carts()
+        self.client.force_login(self.admin)
+        item = IngredientRecipe.objects.filter(recipe=self.recipes[0])[0]
+        url = '/admin/recipes/ingredientrecipe/'
+        for path, data in (
+            (f'{item.pk}/change/', {
+                'recipe': self.recipes[1].pk,
+                'ingredient': self.extra_ingredient.pk, 'amount': 50,
+            }),
+            ('add/', {
+                'recipe': self.recipes[0].pk,
+                'ingredient': self.extra_ingredient.pk, 'amount': 3,
+            }),
+            (f'{item.pk}/delete/', {'post': 'yes'}),
+        ):
+            with self.subTest(path=path):
+                response = self.client.post(url + path, data)
+                self.assertEqual(response.status_code, 302)
+                self.assert_consistent()
+
+    def test_move_recipe_mark(self):
+        self.fill_carts()
+        FavoriteRecipe.objects.create(
+            user=self.users[0], recipe=self.recipes[0]
+        )
+        for model in (FavoriteRecipe, ShoppingCart):
+            with self.subTest(model=model.__name__):
+                mark = model.objects.get(
+                    user=self.users[0], recipe=self.recipes[0]
+                )
+                mark.recipe = self.create_recipe('Новый рецепт')
+                mark.save()
+                self.assert_consistent()
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+})
+class DeletionTest(TestCase):
+    """Удаление рецептов и пользователей сохраняет счётчики и списки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{i}@foodgram.ru', username=f'user{i}',
+                password='password', first_name='Иван', last_name='Иванов'
+            )
+            for i in range(4)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(2)
+        ]
+        cls.recipes = [
+            cls.create_recipe(author, f'Рецепт {author.username} {i}')
+            for author in cls.users[:2]
+            for i in range(2)
+        ]
+        for user in cls.users:
+            for author in cls.users[:2]:
+                if author != user:
+                    Subscription.objects.create(user=user, author=author)
+            for recipe in cls.recipes:
+                FavoriteRecipe.objects.create(user=user, recipe=recipe)
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    @classmethod
+    def create_recipe(cls, author, name):
+        recipe = Recipe.objects.create(
+            author=author, name=name, image='recipes/image.png',
+            description='Описание', cooking_time=10
+        )
+        for ingredient in cls.ingredients:
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=5
+            )
+        return recipe
+
+    def assert_consistent(self):
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+        self.assertEqual(get_stored_amounts(), get_expected_amounts())
+
+    def test_delete_recipes(self):
+        author = self.users[0]
+        delete_recipes(Recipe.objects.filter(author=author))
+        self.assertFalse(Recipe.objects.filter(author=author).exists())
+        self.assert_consistent()
+
+    def test_delete_users(self):
+        delete_users(User.objects.filter(pk__in=(
+            self.users[0].pk, self.users[2].pk
+        )))
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assert_consistent()
+
+    def test_delete_queries(self):
+        recipe = self.create_recipe(self.users[2], 'Новый рецепт')
+        FavoriteRecipe.objects.create(user=self.users[3], recipe=recipe)
+        ShoppingCart.objects.create(user=self.users[3], recipe=recipe)
+        queries = []
+        for recipe in (recipe, self.recipes[0]):
+            with CaptureQueriesContext(connection) as context:
+                delete_recipes(Recipe.objects.filter(pk=recipe.pk))
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+        self.assert_consistent()
+
+
+@mock.patch(
+    'recipes.management.commands.load_ingredients.tqdm',
+    lambda iterable, **kwargs: iterable
+)
+class LoadIngredientsTest(TestCase):
+    """Повторный импорт ингредиентов ничего не добавляет."""
+
+    ingredients = [
+        {'name': f'ингредиент {i}', 'measurement_unit': 'г'}
+        for i in range(5)
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.json_path = Path(directory.name) / 'ingredients.json'
+        self.json_path.write_text(
+            json.dumps(self.ingredients, ensure_ascii=False),
+            encoding='utf-8'
+        )
+        self.csv_path = Path(directory.name) / 'ingredients.csv'
+        self.csv_path.write_text(
+            ''.join(
+                f'{item["name"]},{item["measurement_unit"]}\n'
+                for item in self.ingredients + [
+                    {'name': 'новый ингредиент', 'measurement_unit': 'кг'}
+                ]
+            ),
+            encoding='utf-8'
+        )
+
+    def load(self, path):
+        stdout = StringIO()
+        call_command(
+            'load_ingredients', path=path, batch_size=2, stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def test_load_twice(self):
+        self.assertIn('Добавлено: 5, пропущено: 0', self.load(self.json_path))
+        # Точка сохранения, подсчёт до и после и запрос на пакет.
+        with self.assertNumQueries(7):
+            output = self.load(self.json_path)
+        self.assertIn('Добавлено: 0, пропущено: 5', output)
+        self.assertEqual(Ingredient.objects.count(), len(self.ingredients))
+
+    def test_load_csv(self):
+        self.load(self.json_path)
+        self.assertIn('Добавлено: 1, пропущено: 5', self.load(self.csv_path))
+        self.assertIn('Добавлено: 0, пропущено: 6', self.load(self.csv_path))
+
+    def test_json_chunks(self):
+        file = StringIO(json.dumps(self.ingredients, ensure_ascii=False))
+        self.assertEqual(
+            list(iter_json_array(file, chunk_size=7)), self.ingredients
+        )
+
+    def test_invalid_json(self):
+        self.json_path.write_text('[{"name": ', encoding='utf-8')
+        with self.assertRaises(CommandError):
+            self.load(self.json_path)
+        self.assertFalse(Ingredient.objects.exists())
@@ -0,0 +1,58 @@
+"""Номера версий данных для сброса кэшей и индексов.
+
+Версия - случайная метка в общем кэше. Если метка пропала из кэша,
+создаётся новая, поэтому устаревшие данные не используются повторно.
+"""
+from uuid import uuid4
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+COUNTERS_VERSION_KEY = 'counters_version'
+INGREDIENTS_VERSION_KEY = 'ingredients_version'
+RECIPES_VERSION_KEY = 'recipes_version'
+SCORES_VERSION_KEY = 'scores_version'
+TAGS_VERSION_KEY = 'tags_version'
+USERS_VERSION_KEY = 'users_version'
+
+
+def is_shared_cache():
+    """Видят ли версии, изменённые одним процессом, остальные процессы.
+
+    Кэш в памяти процесса видит только сам процесс: изменения версий
+    из команд управления до веб-сервера не доходят.
+    """
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def recipe_version_key(recipe_id):
+    return f'recipe_version:{recipe_id}'
+
+
+def user_version_key(user_id):
+    return f'user_version:{user_id}'
+
+
+def user_state_version_key(user_id):
+    """Версия избранного, списка покупок и подписок пользователя."""
+    return f'user_state_version:{user_id}'
+
+
+def get_versions(keys):
+    """Текущие версии для ключей keys."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        cache.add(key, uuid4().hex, None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def get_version(key):
+    return get_versions((key,))[key]
+
+
+def bump_versions(*keys):
+    """Отмечает данные с ключами keys изменившимися."""
+    cache.set_many({key: uuid4().hex for key in keys}, None)
@@ -1,18 +1,31 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from recipes.deletion import delete_users
 from users.models import Subscription, User
 
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
-    list_display = ('id', 'email', 'username', 'first_name', 'last_name')
-    search_fields = ('username',)
-    list_filter = ('email', 'first_name')
+    list_display = (
+        'id', 'email', 'username', 'first_name', 'last_name',
+        'recipes_count', 'followers_count'
+    )
+    search_fields = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    show_full_result_count = False
+
+    def delete_model(self, request, obj):
+        delete_users(User.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_users(queryset)
 
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
-    search_fields = ('user', 'author')
-    list_filter = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
@@ -5,7 +5,9 @@ from django.db.models import (
     CharField,
     EmailField,
     ForeignKey,
+    Index,
     Model,
+    PositiveIntegerField,
     UniqueConstraint,
     CheckConstraint,
     F, Q,
@@ -17,9 +19,10 @@ from foodgram.constants import (
     MAX_NAME_LENGTH,
     MAX_PASSWORD_LENGTH,
 )
+from foodgram.mixins import CounterFieldsMixin
 
 
-class User(AbstractUser):
+class User(CounterFieldsMixin, AbstractUser):
     """Модель пользователя."""
     email = EmailField(
         'Электронная почта',
@@ -46,6 +49,18 @@ class User(AbstractUser):
         'Пароль',
         max_length=MAX_PASSWORD_LENGTH
     )
+    recipes_count = PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'password', 'first_name', 'last_name')
@@ -79,6 +94,12 @@ class Subscription(Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ('-author_id',)
+        indexes = [
+            Index(
+                fields=('author', 'user'),
+                name='subscription_author_user_idx'
+            ),
+        ]
         constraints = [
             UniqueConstraint(
                 fields=('user', 'author'),
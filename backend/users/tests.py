@@ -0,0 +1,36 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from users.models import Subscription, User
+
+
+class AdminQueryCountTest(TestCase):
+    """Число запросов страниц админки не зависит от числа строк."""
+
+    rows = 20
+    # Сессия, пользователь, количество строк и строки страницы.
+    CHANGELIST_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@foodgram.ru', username='admin', password='password',
+            first_name='Админ', last_name='Админов'
+        )
+        for i in range(cls.rows):
+            author = User.objects.create_user(
+                email=f'author{i}@foodgram.ru', username=f'author{i}',
+                password='password', first_name='Пётр', last_name='Петров'
+            )
+            Subscription.objects.create(user=cls.admin, author=author)
+
+    def setUp(self):
+        ContentType.objects.clear_cache()
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        for url in ('/admin/users/user/', '/admin/users/subscription/'):
+            with self.subTest(url=url):
+                with self.assertNumQueries(self.CHANGELIST_QUERIES):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)